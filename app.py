@@ -1,19 +1,37 @@
 import streamlit as st
 import pandas as pd
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import datetime
 import json
 from datetime import date, datetime as dt
 import calendar
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import importlib.util
 import io
+import multiprocessing
+import os
 import socket
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode, JsCode
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
+import sys
+import threading
+import time
+import types
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
+from paie.db import DbPool, configure, run_query, side_write, sql_tables, transaction
+from paie.temps import DAYS_FR, OPTIONS_STATUT, STD_MS, STD_ME, STD_AS, STD_AE, TIME_COLS, str_to_time, time_to_str, clean_time, day_arrays, get_default_schedule, export_months
+from paie.schema import MIGRATIONS, schema_version, init_db, is_pointages_partitioned, ensure_pointages_partitions, partition_pointages
+from paie.donnees import (GRID_EDIT_COLS, db_upsert_salarie, db_archive_salarie, db_restore_salarie, db_delete_salarie_total, db_save_pointages_bulk, db_fill_empty,
+                          db_update_banque, db_get_salaries, db_get_banque_history, calculate_stats, calculate_stats_many, diff_grid, grid_frame, stats_ytd, rebuild_monthly_stats)
+from paie.miroir import Mirror, describe
+from paie.exports import EXPORT_FORMATS, export_stream
+from paie.backup import create_backup_stream, restore_backup_json
+from paie.releve_pdf import render_releve, render_releves
 
 # --- FIX IPV4 ---
 try:
@@ -29,16 +47,10 @@ except Exception as e:
 # --- CONFIGURATION ---
 st.set_page_config(page_title="Paie & RH", layout="wide", page_icon="👥")
 
-try:
-    from jours_feries_france import JoursFeries
-except ImportError:
+if not importlib.util.find_spec("jours_feries_france"):
     st.error("Manque : pip install jours-feries-france")
     st.stop()
 
-DAYS_FR = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
-OPTIONS_STATUT = ["Normal", "Congé", "Arrêt Maladie", "Absence Injustifiée", "Récupération"]
-STD_MS, STD_ME, STD_AS, STD_AE = "08:30", "12:00", "14:00", "17:30"
-
 # --- SESSION STATE ---
 if 'logged_in' not in st.session_state: st.session_state.logged_in = False
 if 'username' not in st.session_state: st.session_state.username = ""
@@ -50,101 +62,125 @@ if 'confirm_delete_id' not in st.session_state: st.session_state['confirm_delete
 # 1. FONCTIONS SYSTEME & BDD
 # ==================================================================================
 
-# --- CONNEXION SUPABASE ---
+# --- CONNEXION SUPABASE (POOL) ---
+# secrets [postgres] : url, pool_min (1), pool_max (10), ping_after (s d'inactivité avant test de vie, 30)
 @st.cache_resource
-def init_connection():
-    try: return psycopg2.connect(st.secrets["postgres"]["url"])
+def init_pool():
+    cfg = st.secrets["postgres"]
+    try: return DbPool(cfg["url"], int(cfg.get("pool_min", 1)), int(cfg.get("pool_max", 10)), float(cfg.get("ping_after", 30)))
     except Exception as e: st.error(f"Erreur DB: {e}"); st.stop()
 
-def run_query(query, params=None, fetch="all"):
-    conn = init_connection()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        try:
-            cur.execute(query, params)
-            if fetch == "all": return cur.fetchall()
-            elif fetch == "one": return cur.fetchone()
-            elif fetch == "none": conn.commit(); return None
-        except Exception as e:
-            conn.rollback(); st.error(f"SQL Error: {e}"); return None
-
-def init_db():
-    queries = [
-        '''CREATE TABLE IF NOT EXISTS salaries (id SERIAL PRIMARY KEY, nom TEXT NOT NULL, mode_alternance INTEGER DEFAULT 0, solde_banque REAL DEFAULT 0, config_horaires TEXT, is_archived INTEGER DEFAULT 0)''',
-        '''CREATE TABLE IF NOT EXISTS pointages (id SERIAL PRIMARY KEY, salarie_id INTEGER, date_pointage DATE, m_start TEXT, m_end TEXT, a_start TEXT, a_end TEXT, statut TEXT DEFAULT 'Normal', comment TEXT, UNIQUE(salarie_id, date_pointage))''',
-        '''CREATE TABLE IF NOT EXISTS banque_history (id SERIAL PRIMARY KEY, salarie_id INTEGER, date_mouv DATE, montant REAL, motif TEXT, type_mouv TEXT, auteur TEXT)''',
-        '''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, is_admin INTEGER DEFAULT 0, is_active INTEGER DEFAULT 0)'''
-    ]
-    for q in queries: run_query(q, fetch="none")
-# init_db()
-
-# --- UTILITAIRES TEMPS ---
-def str_to_time(t): return dt.strptime(t, "%H:%M").time() if t else None
-def time_to_str(t): return t.strftime("%H:%M") if t else None
-def calc_duree_journee(m_s, m_e, a_s, a_e):
-    def d(s, e):
-        if s and e:
-            try: return max(0.0, (dt.strptime(str(e)[:5],"%H:%M") - dt.strptime(str(s)[:5],"%H:%M")).total_seconds()/3600)
-            except: return 0.0
-        return 0.0
-    return d(m_s, m_e) + d(a_s, a_e)
-def has_ticket_resto(row):
-    if row['statut'] != 'Normal': return False
-    m = calc_duree_journee(row.get('m_start'), row.get('m_end'), None, None)
-    a = calc_duree_journee(None, None, row.get('a_start'), row.get('a_end'))
-    return True if (m > 0 and a > 0) else False
-def is_even_week(d): return d.isocalendar()[1] % 2 == 0
-def get_config_for_day(emp_json, d_obj):
-    if not emp_json: return None, None, None, None
-    config = json.loads(emp_json)
-    key = 'paire' if is_even_week(d_obj) else 'impaire'
-    if key not in config: key = 'paire'
-    d = config[key][d_obj.weekday()]
-    return d['ms'], d['me'], d['as'], d['ae']
-def get_default_schedule():
-    std = {'ms': STD_MS, 'me': STD_ME, 'as': STD_AS, 'ae': STD_AE}
-    empty = {'ms': None, 'me': None, 'as': None, 'ae': None}
-    week = [std.copy() for _ in range(5)] + [empty.copy()] + [empty.copy()]
-    return {'paire': week, 'impaire': week}
-
-# --- FONCTIONS BASE DE DONNEES ---
-def db_upsert_salarie(id_s, nom, mode, sched):
-    j = json.dumps(sched)
-    chk = run_query("SELECT id FROM salaries WHERE nom=%s", (nom,), fetch="one")
-    if chk and (id_s is None or chk['id'] != id_s): return False, "Nom pris."
-    if id_s is None: run_query('INSERT INTO salaries (nom, mode_alternance, config_horaires, is_archived) VALUES (%s,%s,%s,0)', (nom, mode, j), fetch="none")
-    else: run_query('UPDATE salaries SET nom=%s, mode_alternance=%s, config_horaires=%s WHERE id=%s', (nom, mode, j, id_s), fetch="none")
-    return True, "Sauvegardé."
-def db_archive_salarie(s_id): run_query('UPDATE salaries SET is_archived = 1 WHERE id = %s', (s_id,), fetch="none")
-def db_restore_salarie(s_id): run_query('UPDATE salaries SET is_archived = 0 WHERE id = %s', (s_id,), fetch="none")
-def db_delete_salarie_total(s_id):
-    run_query('DELETE FROM pointages WHERE salarie_id = %s', (s_id,), fetch="none")
-    run_query('DELETE FROM banque_history WHERE salarie_id = %s', (s_id,), fetch="none")
-    run_query('DELETE FROM salaries WHERE id = %s', (s_id,), fetch="none")
-def db_save_pointage(s_id, d_obj, ms, me, ads, ae, stat, cmt):
-    if isinstance(d_obj, str):
-        try: d_iso = dt.strptime(d_obj, "%d/%m/%Y").strftime("%Y-%m-%d")
-        except: d_iso = d_obj 
-    else: d_iso = d_obj.strftime("%Y-%m-%d")
-    run_query('''INSERT INTO pointages (salarie_id, date_pointage, m_start, m_end, a_start, a_end, statut, comment) 
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s) ON CONFLICT (salarie_id, date_pointage) 
-        DO UPDATE SET m_start=EXCLUDED.m_start, m_end=EXCLUDED.m_end, a_start=EXCLUDED.a_start, a_end=EXCLUDED.a_end, statut=EXCLUDED.statut, comment=EXCLUDED.comment''', 
-        (s_id, d_iso, ms, me, ads, ae, stat, cmt), fetch="none")
-def db_update_banque(s_id, montant, motif, type_mouv="Manuel"):
-    aut = st.session_state.username
-    td = date.today().strftime("%Y-%m-%d")
-    run_query('INSERT INTO banque_history (salarie_id, date_mouv, montant, motif, type_mouv, auteur) VALUES (%s,%s,%s,%s,%s,%s)', (s_id, td, montant, motif, type_mouv, aut), fetch="none")
-    run_query('UPDATE salaries SET solde_banque = solde_banque + %s WHERE id = %s', (montant, s_id), fetch="none")
-
-def db_get_transferred_hs_for_month(s_id, month_label):
-    pattern = f"%HS% {month_label}%"
-    row = run_query('SELECT SUM(montant) as total FROM banque_history WHERE salarie_id=%s AND motif LIKE %s', (s_id, pattern), fetch="one")
-    return row['total'] if row['total'] else 0.0
-
-def db_get_banque_history(s_id): return run_query('SELECT * FROM banque_history WHERE salarie_id=%s ORDER BY id DESC', (s_id,), fetch="all")
-def db_get_pointages(s_id, y, m):
-    last = calendar.monthrange(y, m)[1]
-    rows = run_query('SELECT * FROM pointages WHERE salarie_id=%s AND date_pointage BETWEEN %s AND %s', (s_id, f"{y}-{m:02d}-01", f"{y}-{m:02d}-{last}"), fetch="all")
-    return {str(r['date_pointage']): dict(r) for r in rows} if rows else {}
+# --- CACHE DES LECTURES ---
+# SELECT mis en cache par (requête, paramètres) : pour la durée du rerun (session), et entre reruns si secrets [cache] ttl > 0.
+# Toute écriture passant par run_query / run_values invalide les entrées des tables touchées (à nouveau au commit).
+class QueryCache:
+    def __init__(self, ttl, max_entries=2048):
+        self.ttl, self.max_entries, self.lock = ttl, max_entries, threading.Lock()
+        self.entries, self.hits, self.misses = {}, 0, 0
+    def get(self, key):
+        with self.lock:
+            e = self.entries.get(key)
+            if e and time.monotonic() - e[0] < self.ttl: self.hits += 1; return True, e[2]
+            self.misses += 1; return False, None
+    def put(self, key, tables, res):
+        with self.lock:
+            if len(self.entries) >= self.max_entries: self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (time.monotonic(), tables, res)
+    def invalidate(self, tables):
+        with self.lock:
+            for k in [k for k, e in self.entries.items() if e[1] & tables]: del self.entries[k]
+
+@st.cache_resource
+def shared_cache(): return QueryCache(float(st.secrets.get("cache", {}).get("ttl", 0)))
+
+def qcache_begin_rerun():
+    prev = st.session_state.get('_qc')
+    if prev: st.session_state['_qc_last'] = (prev["hits"], prev["misses"])
+    st.session_state['_qc'] = {"entries": {}, "hits": 0, "misses": 0}
+def rerun_cache():
+    # Cache du rerun en cours ; None hors d'un script Streamlit (threads de téléchargement différé, etc.)
+    return st.session_state.get('_qc') if get_script_run_ctx() else None
+def qcache_get(key):
+    rc = rerun_cache()
+    if rc is not None and key in rc["entries"]: rc["hits"] += 1; return True, rc["entries"][key][1]
+    sc = shared_cache()
+    found, res = sc.get(key) if sc.ttl > 0 else (False, None)
+    if rc is not None:
+        if found: rc["hits"] += 1; rc["entries"][key] = (sql_tables(key[0]), res)
+        else: rc["misses"] += 1
+    return found, res
+def qcache_put(key, res):
+    tables = sql_tables(key[0])
+    rc = rerun_cache()
+    if rc is not None: rc["entries"][key] = (tables, res)
+    if shared_cache().ttl > 0: shared_cache().put(key, tables, res)
+def qcache_invalidate(tables):
+    if not tables: return
+    rc = rerun_cache()
+    if rc is not None:
+        for k in [k for k, e in rc["entries"].items() if e[0] & tables]: del rc["entries"][k]
+    shared_cache().invalidate(tables)
+
+# --- INSTRUMENTATION ---
+# Par rerun (session) : requêtes, temps DB, lignes, sections Python chronométrées (perf_section) ; historique des
+# N derniers reruns pour le panneau admin. Requêtes et traitements hors rerun plus lents que le seuil : journal partagé.
+# secrets [perf] : slow_ms (500), history (20)
+@st.cache_resource
+def perf_settings():
+    cfg = st.secrets.get("perf", {})
+    return float(cfg.get("slow_ms", 500)) / 1000, int(cfg.get("history", 20))
+@st.cache_resource
+def slow_log(): return collections.deque(maxlen=200)
+
+def perf_current():
+    # Compteurs du rerun en cours ; None hors d'un script Streamlit
+    return st.session_state.get('_perf') if get_script_run_ctx() else None
+def perf_begin_rerun():
+    perf_end_rerun(final=False)
+    st.session_state['_perf'] = {"at": dt.now().strftime("%H:%M:%S"), "start": time.perf_counter(), "last": time.perf_counter(), "queries": 0, "db": 0.0, "rows": 0, "sections": {}}
+def perf_end_rerun(final=True):
+    # Fin de script ; sinon (st.stop / st.rerun) le rerun est clos au suivant, à la date de son dernier événement
+    p = st.session_state.pop('_perf', None)
+    if not p: return
+    total = (time.perf_counter() if final else p["last"]) - p["start"]; qc = st.session_state.get('_qc') or {}
+    row = {"Heure": p["at"], "Total ms": round(total * 1000), "Requêtes": p["queries"], "Cache": qc.get("hits", 0), "Lignes": p["rows"],
+           "DB ms": round(p["db"] * 1000), "Python ms": round((total - p["db"]) * 1000)} | {f"{k} ms": round(v * 1000) for k, v in p["sections"].items()}
+    st.session_state['_perf_hist'] = (st.session_state.get('_perf_hist', []) + [row])[-perf_settings()[1]:]
+def perf_slow(kind, dur, rows, text):
+    slow_log().append({"Heure": dt.now().strftime("%H:%M:%S"), "Type": kind, "ms": round(dur * 1000), "Lignes": rows, "Détail": " ".join(text.split())[:300]})
+def perf_query(query, dur, rows):
+    p = perf_current()
+    if p is not None: p["queries"] += 1; p["db"] += dur; p["rows"] += rows; p["last"] = time.perf_counter()
+    if dur >= perf_settings()[0]: perf_slow("SQL", dur, rows, query)
+@contextlib.contextmanager
+def perf_section(name):
+    t = time.perf_counter()
+    try: yield
+    finally:
+        dur, p = time.perf_counter() - t, perf_current()
+        if p is not None: p["sections"][name] = p["sections"].get(name, 0) + dur; p["last"] = time.perf_counter()
+        elif dur >= perf_settings()[0]: perf_slow("Section", dur, None, name)
+
+# --- CŒUR (paie) ---
+# Calculs, requêtes, exports, backup : package paie, sans Streamlit. Branché ici sur le pool (st.secrets), le cache des
+# lectures, le chronométrage et l'affichage des erreurs (st.error) ; la CLI (python -m paie) s'en passe.
+configure(pool=init_pool, on_error=st.error, cache_get=qcache_get, cache_put=qcache_put, invalidate=qcache_invalidate, on_query=perf_query, section=perf_section)
+
+YEARS = (2024, 2030)  # années proposées à la saisie ; pointages partitionnés : une partition par année de la plage
+
+@st.cache_resource
+def ensure_schema():
+    init_db()
+    if is_pointages_partitioned(): ensure_pointages_partitions(YEARS[1], YEARS[0])
+    return True
+
+# Miroir local optionnel (base distante lente ou instable) : secrets [mirror] path = fichier SQLite, sync_every (s, défaut 15),
+# overlap (s, défaut 300). Lectures et saisies servies localement, envoyées à Postgres en tâche de fond.
+@st.cache_resource
+def init_mirror():
+    cfg = st.secrets.get("mirror", {})
+    if not cfg.get("path"): return None
+    return Mirror(cfg["path"], float(cfg.get("overlap", 300))).start(float(cfg.get("sync_every", 15)))
 
 # --- USERS ---
 def create_user(u, p):
@@ -167,87 +203,170 @@ def admin_actions_user(act, tgt, val=None):
     elif act=="demote": run_query('UPDATE users SET is_admin=0 WHERE username=%s', (tgt,), fetch="none")
     elif act=="transfer":
         curr = st.session_state.username
-        run_query('UPDATE users SET is_admin=1 WHERE username=%s', (tgt,), fetch="none")
-        run_query('UPDATE users SET is_admin=0 WHERE username=%s', (curr,), fetch="none")
-
-# --- BACKUP ---
-def create_backup_json():
-    d = {t: run_query(f"SELECT * FROM {t}", fetch="all") for t in ["salaries", "pointages", "banque_history", "users"]}
-    return json.dumps(d, indent=4, default=str)
-def restore_backup_json(f):
+        try:
+            with transaction():
+                run_query('UPDATE users SET is_admin=1 WHERE username=%s', (tgt,), fetch="none")
+                run_query('UPDATE users SET is_admin=0 WHERE username=%s', (curr,), fetch="none")
+        except Exception as e: st.error(f"SQL Error: {e}")
+
+# --- RELEVÉS PDF ---
+# Rendu dans un pool de processus (secrets [pdf] : workers, cache_max) ; chaque PDF est gardé en mémoire
+# sous (salarié, année, mois, empreinte des stats) : un relevé inchangé n'est pas re-rendu.
+class PdfCache:
+    def __init__(self, max_entries):
+        self.max_entries, self.lock, self.entries = max_entries, threading.Lock(), {}
+    def get(self, key):
+        with self.lock:
+            v = self.entries.pop(key, None)
+            if v is not None: self.entries[key] = v
+            return v
+    def put(self, key, pdf):
+        with self.lock:
+            self.entries.pop(key, None)
+            while len(self.entries) >= self.max_entries: self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = pdf
+
+@st.cache_resource
+def pdf_cache(): return PdfCache(int(st.secrets.get("pdf", {}).get("cache_max", 500)))
+
+PDF_POOL_LOCK = threading.Lock()
+
+@contextlib.contextmanager
+def neutral_main():
+    # Streamlit installe le script comme __main__ : sans ce détour, chaque worker spawn ré-exécuterait app.py
+    main = sys.modules["__main__"]; sys.modules["__main__"] = types.ModuleType("__main__")
+    try: yield
+    finally: sys.modules["__main__"] = main
+
+@st.cache_resource
+def pdf_pool():
+    # Tous les workers sont lancés ici, une seule fois (un submit par worker, lancé dans l'appel) : __main__ n'est
+    # remplacé que le temps de ce démarrage, sous verrou, et plus jamais pendant les rendus des autres sessions
+    n = int(st.secrets.get("pdf", {}).get("workers", min(4, os.cpu_count() or 1)))
+    ex = ProcessPoolExecutor(n, mp_context=multiprocessing.get_context("spawn"))
+    with PDF_POOL_LOCK, neutral_main(): warm = [ex.submit(os.getpid) for _ in range(n)]
+    for f in warm: f.result()
+    return ex
+
+def pdf_map(fn, items):
+    # Un seul document : rendu sur place, sinon réparti sur le pool (repli séquentiel si le pool est cassé)
+    if len(items) < 2: return [fn(i) for i in items]
     try:
-        d = json.load(f)
-        run_query("TRUNCATE pointages, banque_history, salaries, users RESTART IDENTITY", fetch="none")
-        for u in d.get('users', []): run_query("INSERT INTO users VALUES (%s,%s,%s,%s)", (u['username'], u['password'], u['is_admin'], u['is_active']), fetch="none")
-        for s in d.get('salaries', []): run_query("INSERT INTO salaries (id, nom, mode_alternance, solde_banque, config_horaires, is_archived) OVERRIDING SYSTEM VALUE VALUES (%s,%s,%s,%s,%s,COALESCE(%s,0))", (s['id'], s['nom'], s['mode_alternance'], s['solde_banque'], s['config_horaires'], s.get('is_archived',0)), fetch="none")
-        for p in d.get('pointages', []): run_query("INSERT INTO pointages VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)", (p['id'], p['salarie_id'], p['date_pointage'], p['m_start'], p['m_end'], p['a_start'], p['a_end'], p['statut'], p['comment']), fetch="none")
-        for b in d.get('banque_history', []): run_query("INSERT INTO banque_history VALUES (%s,%s,%s,%s,%s,%s,%s)", (b['id'], b['salarie_id'], b['date_mouv'], b['montant'], b['motif'], b['type_mouv'], b['auteur']), fetch="none")
-        return True
-    except Exception as e: st.error(f"Err: {e}"); return False
-
-# --- CALCUL STATS (HARMONISÉ) ---
-def calculate_stats(sid, y, m, cfg):
-    db_pts = db_get_pointages(sid, y, m)
-    banked = db_get_transferred_hs_for_month(sid, f"{m}/{y}")
-    _, last = calendar.monthrange(y, m)
-    days = [date(y, m, d) for d in range(1, last+1)]
-    feries = JoursFeries.for_year(y)
-    wh, nr, nt, nc, nm, na, tr, det = {}, 0, 0, 0, 0, 0, 0, []
-    
-    for d in days:
-        row = db_pts.get(d.strftime("%Y-%m-%d"), {})
-        stt = row.get('statut', 'Normal')
-        rms, rme, ras, rae = row.get('m_start'), row.get('m_end'), row.get('a_start'), row.get('a_end')
-        tms, tme, tas, tae = get_config_for_day(cfg, d)
-        if not row: rms=rme=ras=rae=None; stt="Normal"
-        hr = calc_duree_journee(rms, rme, ras, rae)
-        ht = calc_duree_journee(tms, tme, tas, tae)
-        
-        # Compteurs
-        if stt=="Congé": nc+=1
-        elif stt=="Arrêt Maladie": nm+=1
-        elif stt=="Absence Injustifiée": na+=1
-        
-        if has_ticket_resto({'statut':stt,'m_start':rms,'m_end':rme,'a_start':ras,'a_end':rae}): tr+=1
-        
-        h_bk = ht if (stt!="Normal" and stt!="Récupération") else (0.0 if stt=="Récupération" else hr)
-        nr+=h_bk; nt+=ht
-        wn=d.isocalendar()[1]
-        if wn not in wh: wh[wn]=0.0
-        wh[wn]+=hr
-        det.append({"Date": d.strftime("%d/%m/%Y"), "Jour": DAYS_FR[d.weekday()], "Statut": stt, "Matin": f"{rms}-{rme}" if rms else "", "Aprem": f"{ras}-{rae}" if ras else "", "Heures": hr})
-    
-    h25, h50, ghs = 0, 0, 0
-    for w, h in wh.items():
-        if h>35:
-            s = h-35; ghs+=s
-            h25+=min(s,8); h50+=max(0,s-8)
-            
-    # RETOUR DICTIONNAIRE
-    return {
-        "total_real": nr, 
-        "total_tr": tr, 
-        "nb_conge": nc, 
-        "nb_maladie": nm, 
-        "nb_abs": na, 
-        "gen_hs_total": ghs, 
-        "hs_25": h25, 
-        "hs_50": h50, 
-        "banked": banked, 
-        "hs_payable": max(0, ghs-banked), 
-        "delta_bank": nr-nt, 
-        "details": det
-    }
-
-def create_pdf_releve(nom, per, st):
-    b = io.BytesIO(); doc = SimpleDocTemplate(b, pagesize=A4); el = []; s = getSampleStyleSheet()
-    el.append(Paragraph(f"Relevé: {nom} - {per}", s['Heading1'])); el.append(Spacer(1, 0.5*cm))
-    d = [["H. Trav.", f"{st['total_real']:.2f}", "TR", f"{st['total_tr']}"], ["HS Tot", f"{st['gen_hs_total']:.2f}", "Congé", f"{st['nb_conge']}"], ["A Payer", f"{st['hs_payable']:.2f}", "Maladie", f"{st['nb_maladie']}"]]
-    t = Table(d, colWidths=[4*cm,3*cm,4*cm,3*cm]); t.setStyle(TableStyle([('GRID',(0,0),(-1,-1),1,colors.black),('BACKGROUND',(0,0),(-1,-1),colors.whitesmoke)])); el.append(t); el.append(Spacer(1, 0.5*cm))
-    det = [["Date","Jour","Statut","M","A","Tot"]]
-    for r in st['details']: det.append([r['Date'],r['Jour'][:3],r['Statut'][:10],r['Matin'],r['Aprem'],f"{r['Heures']:.2f}"])
-    t2 = Table(det, colWidths=[2.5*cm,2*cm,3*cm,3*cm,3*cm,1.5*cm]); t2.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.5,colors.grey)])); el.append(t2); doc.build(el); b.seek(0)
-    return b
+        return list(pdf_pool().map(fn, items, chunksize=max(1, len(items) // 16)))
+    except BrokenProcessPool: pdf_pool.clear(); return [fn(i) for i in items]
+
+def stats_digest(nom, s): return hashlib.sha1(json.dumps([nom, s], sort_keys=True, default=str).encode()).hexdigest()
+
+def pdf_releve(emp, y, m, s):
+    key = (emp['id'], y, m, stats_digest(emp['nom'], s)); pdf = pdf_cache().get(key)
+    if pdf is None: pdf = render_releve((emp['nom'], f"{m}/{y}", s)); pdf_cache().put(key, pdf)
+    return pdf
+
+def pdf_releves_batch(emps, y, m, single=False):
+    # Relevés du mois pour tous les salariés : un PDF multi-pages ou un ZIP d'un PDF par salarié
+    all_st = calculate_stats_many([e['id'] for e in emps], y, m, {e['id']: e['config_horaires'] for e in emps})
+    items = [(e['nom'], f"{m}/{y}", all_st[e['id']]) for e in emps]
+    keys = [(e['id'], y, m, stats_digest(e['nom'], all_st[e['id']])) for e in emps]
+    cache = pdf_cache()
+    if single:
+        key = ("lot", y, m, tuple(keys)); pdf = cache.get(key)
+        if pdf is None: pdf = pdf_map(render_releves, [items])[0]; cache.put(key, pdf)
+        return pdf
+    pdfs = [cache.get(k) for k in keys]
+    todo = [i for i, p in enumerate(pdfs) if p is None]
+    for i, pdf in zip(todo, pdf_map(render_releve, [items[i] for i in todo])): pdfs[i] = pdf; cache.put(keys[i], pdf)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        for e, pdf in zip(emps, pdfs): z.writestr(f"Releve_{e['nom']}_{e['id']}_{m:02d}_{y}.pdf".replace("/", "-"), pdf)
+    return out.getvalue()
+
+# --- TÂCHES DE FOND ---
+# Traitements lourds (export, relevés, backup, restauration, remplissage, cumuls) exécutés dans un pool de threads :
+# la session n'est pas bloquée, et l'état (progression, résultat à télécharger) vit dans la table jobs, donc survit
+# à un rechargement de l'onglet. secrets [jobs] : workers (2), keep_days (7)
+JOB_ACTIVE = ("en attente", "en cours")
+JOB_ICONS = {"en attente": "⏳", "en cours": "🔄", "terminé": "✅", "erreur": "❌"}
+JOB_CHUNK = 4 * 1024 * 1024
+
+@st.cache_resource
+def job_executor():
+    # Premier appel du processus : les tâches laissées actives par un serveur précédent ne finiront jamais
+    run_query("UPDATE jobs SET status='erreur', error='Interrompue (redémarrage du serveur)', finished_at=now() WHERE status IN %s", (JOB_ACTIVE,), fetch="none")
+    return ThreadPoolExecutor(int(st.secrets.get("jobs", {}).get("workers", 2)), thread_name_prefix="job")
+
+def job_submit(kind, label, fn, *args):
+    # fn(progress, *args) -> message, ou (données, nom de fichier, type MIME, message) ; renvoie l'id de la tâche
+    ex = job_executor()
+    run_query("DELETE FROM jobs WHERE finished_at < now() - %s * interval '1 day'", (int(st.secrets.get("jobs", {}).get("keep_days", 7)),), fetch="none")
+    row = run_query("INSERT INTO jobs (kind, label, owner) VALUES (%s,%s,%s) RETURNING id", (kind, label, st.session_state.username if st.session_state.logged_in else None), fetch="one")
+    if not row: return None
+    ex.submit(job_run, row['id'], fn, args)
+    return row['id']
+
+def job_run(job_id, fn, args):
+    last = [0.0]
+    def progress(p, msg=None):
+        # Au plus 2 écritures par seconde, hors de la transaction de l'opération (export, backup, restauration) : visibles tout de suite
+        if p < 1 and time.monotonic() - last[0] < 0.5: return
+        last[0] = time.monotonic()
+        with side_write(): run_query("UPDATE jobs SET progress=%s, message=COALESCE(%s, message) WHERE id=%s", (float(p), msg, job_id), fetch="none")
+    run_query("UPDATE jobs SET status='en cours', started_at=now() WHERE id=%s", (job_id,), fetch="none")
+    try:
+        res = fn(progress, *args)
+        data, name, mime, msg = res if isinstance(res, tuple) else (None, None, None, res)
+        if data is not None:
+            # Résultat (fichier ou octets) copié dans job_chunks, un morceau par ligne : ni recopie du résultat à chaque ajout, ni plafond BYTEA
+            f = data if hasattr(data, "read") else io.BytesIO(data)
+            with transaction():
+                for seq, chunk in enumerate(iter(lambda: f.read(JOB_CHUNK), b"")):
+                    run_query("INSERT INTO job_chunks (job_id, seq, data) VALUES (%s,%s,%s)", (job_id, seq, psycopg2.Binary(chunk)), fetch="none")
+        run_query("UPDATE jobs SET status='terminé', progress=1, message=%s, result_name=%s, result_mime=%s, finished_at=now() WHERE id=%s",
+                  (msg, name if data is not None else None, mime, job_id), fetch="none")
+    except Exception as e:
+        run_query("UPDATE jobs SET status='erreur', error=%s, finished_at=now() WHERE id=%s", (str(e)[:2000], job_id), fetch="none")
+
+def job_result(job_id):
+    # Réassemblé morceau par morceau (une requête chacun), dans une transaction : jamais servi depuis le cache de requêtes
+    out = bytearray()
+    with transaction():
+        for r in run_query("SELECT seq FROM job_chunks WHERE job_id=%s ORDER BY seq", (job_id,), fetch="all") or []:
+            out += run_query("SELECT data FROM job_chunks WHERE job_id=%s AND seq=%s", (job_id, r['seq']), fetch="one")['data']
+    return bytes(out)
+
+def job_export(progress, emps, months, fmt, tag):
+    f = export_stream(emps, months, fmt, progress=progress)
+    return f, f"Paie_Global_{tag}." + ("xlsx" if fmt == "xlsx" else "zip"), None, f"{len(emps)} salarié(s) × {len(months)} mois"
+def job_releves(progress, emps, y, m, single):
+    return pdf_releves_batch(emps, y, m, single), f"Releves_{m:02d}_{y}." + ("pdf" if single else "zip"), "application/pdf" if single else "application/zip", f"{len(emps)} relevé(s)"
+def job_backup(progress, since):
+    f = create_backup_stream(since, progress=progress); size = f.seek(0, 2); f.seek(0)
+    return f, f"Backup_{date.today()}" + (f"_depuis_{since}" if since else "") + ".jsonl.gz", "application/gzip", f"{size // 1024} Ko"
+def job_restore(progress, data):
+    err = []
+    if not restore_backup_json(io.BytesIO(data), progress, on_error=err.append): raise RuntimeError(err[0] if err else "Restauration échouée")
+    return "Restauration terminée"
+def job_fill(progress, emps, d_from, d_to):
+    n = db_fill_empty(emps, d_from, d_to)
+    if n is None: raise RuntimeError("Erreur SQL pendant le remplissage")
+    return f"{n} jour(s) remplis"
+def job_rollup(progress):
+    r = rebuild_monthly_stats()
+    if r is None: raise RuntimeError("Erreur SQL pendant le recalcul")
+    return f"{r[0]} mois recalculés, {r[1]} divergeaient"
+
+def jobs_panel(owner, polling):
+    # Tâches récentes de l'utilisateur ; tant que l'une est active, le fragment se relance (run_every) puis la page entière à la fin
+    qcache_invalidate({"jobs"})
+    jobs = run_query("SELECT id, label, status, progress, message, error, result_name, result_mime, EXISTS (SELECT 1 FROM job_chunks c WHERE c.job_id = jobs.id) AS has_result FROM jobs WHERE owner IS NOT DISTINCT FROM %s ORDER BY id DESC LIMIT 8", (owner,), fetch="all") or []
+    if polling and not any(j['status'] in JOB_ACTIVE for j in jobs): st.rerun()
+    for j in jobs:
+        st.caption(f"{JOB_ICONS[j['status']]} #{j['id']} {j['label']} — {j['error'] or j['message'] or j['status']}")
+        if j['status'] == "en cours": st.progress(min(1.0, j['progress'] or 0.0))
+        if j['has_result']: st.download_button("⬇️", functools.partial(job_result, j['id']), j['result_name'], j['result_mime'] or "application/octet-stream", key=f"job_dl_{j['id']}")
+def show_jobs(owner):
+    active = run_query("SELECT count(*) AS n FROM jobs WHERE owner IS NOT DISTINCT FROM %s AND status IN %s", (owner, JOB_ACTIVE), fetch="one")
+    polling = bool(active and active['n'])
+    st.fragment(jobs_panel, run_every=2 if polling else None)(owner, polling)
 
 def render_week_inputs_simple(prefix, default_data):
     if st.button("⚡ Remplir Formulaire", key=f"btn_{prefix}"):
@@ -270,13 +389,83 @@ def render_week_inputs_simple(prefix, default_data):
         new_data.append({'ms': time_to_str(ms), 'me': time_to_str(me), 'as': time_to_str(ads), 'ae': time_to_str(ae)})
     return new_data
 
+# --- GRILLE DE SAISIE ---
+# Fragment : une modification de cellule ne relance que la grille, pas toute la page. Les jours modifiés forment un
+# brouillon en session (par salarié / mois) jusqu'à la sauvegarde ; seuls ces jours sont recalculés.
+GRID_ROW_STYLE = JsCode("""function(params) {
+    let style = {'color': 'black', 'background-color': 'white'};
+    if (params.data.is_ferie === 1 || params.data.is_sun === 1) style['background-color'] = '#e0e0e0';
+    if (params.data.Type === 'Arrêt Maladie') style['background-color'] = '#ffb3b3';
+    if (params.data.Type === 'Congé') style['background-color'] = '#b3d9ff';
+    if (params.data.Type === 'Absence Injustifiée') { style['background-color'] = '#ff4d4d'; style['color'] = 'white'; }
+    if (params.data.Type === 'Récupération') style['background-color'] = '#ccffcc';
+    return style;
+}""")
+
+@functools.lru_cache(maxsize=8)
+def grid_options(layout):
+    # Options AgGrid par disposition de colonnes ((nom, dtype), ...) : construites une fois (copier avant usage, AgGrid les modifie)
+    gb = GridOptionsBuilder.from_dataframe(pd.DataFrame({c: pd.Series(dtype=t) for c, t in layout}))
+    gb.configure_column("is_ferie", hide=True); gb.configure_column("is_sun", hide=True)
+    gb.configure_column("Date", width=90); gb.configure_column("Jour", width=120); gb.configure_column("Total", width=60); gb.configure_column("TR", width=50)
+    gb.configure_column("Type", editable=True, cellEditor='agSelectCellEditor', cellEditorParams={'values': OPTIONS_STATUT}, width=130)
+    gb.configure_column("Commentaire", editable=True, width=200)
+    for c in ["Matin Début", "Matin Fin", "Aprèm Début", "Aprèm Fin"]: gb.configure_column(c, editable=True, width=90)
+    gb.configure_grid_options(getRowStyle=GRID_ROW_STYLE)
+    return gb.build()
+def grid_layout(df): return tuple((c, str(t)) for c, t in df.dtypes.items())
+
+def draft_totals(draft, cfg):
+    # {Date: (heures, TR)} des seuls jours du brouillon, avec les règles de day_arrays
+    days = [dt.strptime(d, "%d/%m/%Y").date() for d in draft]
+    pts = {d.strftime("%Y-%m-%d"): dict(zip(TIME_COLS, (clean_time(v) for v in r[1:5])), statut=r[5]) for d, r in zip(days, draft.values())}
+    a = day_arrays(days, pts, cfg)
+    return {k: (h, int(t)) for k, h, t in zip(draft, a["hr"].tolist(), a["tr"].tolist())}
+def grid_with_draft(base, draft, cfg):
+    # Grille du mois avec le brouillon appliqué (affichage après un rerun complet)
+    if not draft: return base
+    df = base.copy(); idx = {d: i for i, d in enumerate(df["Date"])}; tot = draft_totals(draft, cfg)
+    for d, r in draft.items():
+        i = idx[d]; df.loc[i, GRID_EDIT_COLS] = [v or "" for v in r[1:5]] + [r[5], r[6]]; df.loc[i, ["Total", "TR"]] = tot[d]
+    return df
+
+@st.fragment
+def grid_section(emp, y, m, base):
+    dk = f"grid_draft_{emp['id']}_{y}_{m}"; vk = f"{dk}_v"
+    shown = grid_with_draft(base, st.session_state.get(dk, {}), emp['config_horaires'])
+    with perf_section("grille"):
+        resp = AgGrid(shown, gridOptions=copy.deepcopy(grid_options(grid_layout(shown))), height=500, allow_unsafe_jscode=True, theme='streamlit',
+                      update_on=["cellValueChanged"], key=f"grid_{emp['id']}_{y}_{m}_{st.session_state.get(vk, 0)}")
+    data = resp['data']
+    draft = {r[0]: r for r in diff_grid(data if data is not None else shown, base)}
+    st.session_state[dk] = draft
+    c_s, c_a, c_i = st.columns([1, 1, 3])
+    if draft:
+        tot = draft_totals(draft, emp['config_horaires'])
+        tr_delta = sum(t for _, t in tot.values()) - int(base.loc[base["Date"].isin(list(draft)), "TR"].sum())
+        h_month = float(base["Total"].sum()) - float(base.loc[base["Date"].isin(list(draft)), "Total"].sum()) + sum(h for h, _ in tot.values())
+        c_i.caption(f"✏️ {len(draft)} jour(s) non sauvegardé(s) : " + ", ".join(f"{d[:5]} {h:.2f}h" for d, (h, _) in tot.items()) + f" · mois (brouillon) {h_month:.2f}h · TR {tr_delta:+d}")
+        if c_a.button("↩️ Annuler"): st.session_state[dk] = {}; st.session_state[vk] = st.session_state.get(vk, 0) + 1; st.rerun()
+    if c_s.button("💾 SAUVEGARDER SAISIE", type="primary"):
+        bad = [r[0] for r in draft.values() if any(v and clean_time(v) is None for v in r[1:5])]
+        if bad: st.error(f"Heure invalide (HH:MM) : {', '.join(bad)}")
+        else:
+            n = db_save_pointages_bulk(emp['id'], list(draft.values()))
+            if n is not None: st.session_state[dk] = {}; st.session_state[vk] = st.session_state.get(vk, 0) + 1; st.toast(f"Sauvegardé ! ({n} jour(s))", icon="✅"); st.rerun()
+
+ensure_schema()
+configure(mirror=init_mirror())
+# perf d'abord : un rerun interrompu (st.stop / st.rerun) est clos avec les compteurs de cache qui sont encore les siens
+perf_begin_rerun(); qcache_begin_rerun()
+
 # --- LOGIN UI ---
 if not st.session_state.logged_in:
     st.title("☁️ Connexion")
     with st.expander("📤 RESTAURER"):
-        up = st.file_uploader("JSON", type=['json'])
+        up = st.file_uploader("Backup (.json / .jsonl.gz)", type=['json', 'gz'])
         if up and st.button("CONFIRMER"): 
-            if restore_backup_json(up): st.success("OK"); st.rerun()
+            if job_submit("restore", f"Restauration {up.name}", job_restore, up.getvalue()): st.rerun()
+        show_jobs(None)
     t1, t2 = st.tabs(["Login", "Créer"])
     with t1:
         with st.form("l"):
@@ -287,18 +476,37 @@ if not st.session_state.logged_in:
                 else: st.error(s)
     with t2:
         with st.form("c"):
-            nu = st.text_input("ID"); np = st.text_input("MDP", type="password")
+            nu = st.text_input("ID"); mdp = st.text_input("MDP", type="password")
             if st.form_submit_button("Créer"):
-                ok, m = create_user(nu, np)
+                ok, m = create_user(nu, mdp)
                 if ok: st.success(m)
                 else: st.error(m)
     st.stop()
 
 # --- APP ---
-with st.sidebar:
+with st.sidebar, perf_section("sidebar"):
     role = "Admin" if st.session_state.is_admin else "User"
     st.write(f"👤 **{st.session_state.username}** ({role})")
-    st.download_button("⬇️ BACKUP JSON", create_backup_json(), f"Backup_{date.today()}.json", "application/json")
+    with st.expander("⬇️ BACKUP"):
+        since = st.date_input("Modifié depuis (incrémental)", value=None, help="Pointages et mouvements créés ou modifiés depuis ce jour, salariés et utilisateurs complets. Les suppressions ne sont pas incluses.")
+        # Généré uniquement au clic (données différées), plus à chaque rerun
+        st.download_button("⬇️ Télécharger", lambda: create_backup_stream(since).read(), f"Backup_{date.today()}" + (f"_depuis_{since}" if since else "") + ".jsonl.gz", "application/gzip")
+        if st.button("⚙️ En tâche de fond", key="bk_job"): job_submit("backup", "Backup" + (f" depuis {since}" if since else ""), job_backup, since); st.rerun()
+    with st.expander("⚙️ Tâches"): show_jobs(st.session_state.username)
+    mir = init_mirror()
+    if mir:
+        ms = mir.status()
+        with st.expander("🔁 Miroir local" + (f" ⚠️ {ms['conflicts']}" if ms['conflicts'] else "")):
+            st.caption(f"Synchro : {ms['last_sync'] or 'jamais'} · en attente : {ms['pending']}" + (f" · échecs : {ms['failed']}" if ms['failed'] else "") + ("" if ms['ready'] else " · chargement…"))
+            if ms['error']: st.warning(f"Base injoignable ou refus : {ms['error']}")
+            if st.button("🔁 Synchroniser", key="mir_sync"): mir.cycle(); st.rerun()
+            if ms['failed'] and st.button("Réessayer les échecs", key="mir_retry"): mir.retry_failed(); st.rerun()
+            for c in mir.conflicts():
+                st.markdown(f"**{c['nom'] or c['salarie_id']}** — {dt.strptime(c['date_pointage'], '%Y-%m-%d').strftime('%d/%m/%Y')}")
+                st.caption(f"Saisie locale : {describe(c['local'])}  \nVersion distante : {describe(c['remote'])}")
+                k1, k2 = st.columns(2)
+                if k1.button("Garder la mienne", key=f"mir_l_{c['id']}"): mir.resolve(c['id'], True); st.rerun()
+                if k2.button("Garder la distante", key=f"mir_r_{c['id']}"): mir.resolve(c['id'], False); st.rerun()
     st.markdown("---")
     
     if st.session_state.is_admin:
@@ -317,15 +525,27 @@ with st.sidebar:
                 tu = st.selectbox("Cible", active)
                 act = st.selectbox("Action", ["Reset MDP", "Supprimer", "Co-Admin", "Transférer droits", "Rétrograder"])
                 if act == "Reset MDP":
-                    np = st.text_input("New Pass", type="password")
-                    if st.button("OK"): admin_actions_user("reset", tu, np); st.success("Fait")
+                    mdp = st.text_input("New Pass", type="password")
+                    if st.button("OK"): admin_actions_user("reset", tu, mdp); st.success("Fait")
                 elif act == "Supprimer" and st.button("Confirmer"): admin_actions_user("reject", tu); st.rerun()
                 elif act == "Co-Admin" and st.button("Promouvoir"): admin_actions_user("promote", tu); st.rerun()
                 elif act == "Transférer droits" and st.button("Transférer"): admin_actions_user("transfer", tu); st.session_state.is_admin=False; st.rerun()
                 elif act == "Rétrograder" and st.button("Enlever Admin"): admin_actions_user("demote", tu); st.rerun()
         
+        h, m = st.session_state.get('_qc_last', (0, 0)); sc = shared_cache()
+        st.caption(f"Cache SQL — rerun précédent : {h} hits / {m} miss · partagé (ttl {sc.ttl:g}s) : {sc.hits} / {sc.misses}")
+        with st.expander("⏱️ Performances"):
+            hist = st.session_state.get('_perf_hist', [])
+            if hist: st.dataframe(pd.DataFrame(hist[::-1]).fillna(0), hide_index=True)
+            st.caption(f"Requêtes / traitements lents (≥ {perf_settings()[0] * 1000:g} ms)")
+            if slow_log(): st.dataframe(pd.DataFrame(list(slow_log())[::-1]), hide_index=True)
+        with st.expander("🗃️ Base"):
+            st.caption(f"Schéma v{schema_version()} / {MIGRATIONS[-1][0]}")
+            if not is_pointages_partitioned() and st.button("Partitionner pointages par année"):
+                if partition_pointages(): ensure_pointages_partitions(YEARS[1], YEARS[0]); st.success("Fait"); st.rerun()
+            if st.button("Recalculer les cumuls mensuels"): job_submit("rollup", "Cumuls mensuels", job_rollup); st.rerun()
         with st.expander("Salariés (Archives)"):
-            act_sals = run_query("SELECT * FROM salaries WHERE is_archived=0", fetch="all")
+            act_sals = db_get_salaries(0)
             if act_sals:
                 ts = st.selectbox("Actif", [s['nom'] for s in act_sals])
                 tid = next(s['id'] for s in act_sals if s['nom']==ts)
@@ -334,7 +554,7 @@ with st.sidebar:
                 if st.session_state.get('confirm_delete_id') == tid:
                     st.error("⚠️ Irréversible !")
                     if st.button("🔥 CONFIRMER"): db_delete_salarie_total(tid); st.session_state['confirm_delete_id']=None; st.rerun()
-            arc_sals = run_query("SELECT * FROM salaries WHERE is_archived=1", fetch="all")
+            arc_sals = db_get_salaries(1)
             if arc_sals:
                 st.write("---")
                 tas = st.selectbox("Archivé", [s['nom'] for s in arc_sals])
@@ -346,7 +566,7 @@ with st.sidebar:
     mode = st.radio("Mode", ["Nouveau", "Modifier"], horizontal=True)
     f_nom, f_alt, f_sch, f_id = "", False, get_default_schedule(), None
     
-    emps = run_query("SELECT * FROM salaries WHERE is_archived=0", fetch="all")
+    emps = db_get_salaries(0)
     
     if mode == "Modifier":
         if emps:
@@ -382,7 +602,7 @@ with st.sidebar:
 
 # --- MAIN ---
 st.title("🗓️ Planning Cloud")
-employees = run_query("SELECT * FROM salaries WHERE is_archived=0", fetch="all")
+employees = db_get_salaries(0)
 
 if not employees: st.warning("Aucun salarié actif.")
 else:
@@ -391,101 +611,56 @@ else:
     try: curr_emp = emp_map[c1.selectbox("Salarié", list(emp_map.keys()))]
     except: curr_emp = list(emp_map.values())[0]
     today = date.today()
-    yr = c2.number_input("Année", 2024, 2030, today.year)
+    yr = c2.number_input("Année", *YEARS, today.year)
     mo = c3.selectbox("Mois", range(1, 13), index=today.month-1, format_func=lambda x: calendar.month_name[x])
     
     # --- CALCUL DES STATS ---
-    stats = calculate_stats(curr_emp['id'], yr, mo, curr_emp['config_horaires'])
+    with perf_section("stats"): stats = calculate_stats(curr_emp['id'], yr, mo, curr_emp['config_horaires'])
     
     with c4:
         st.write("")
         c_b1, c_b2 = st.columns(2)
-        if c_b1.button("📥 EXCEL"):
-            out = io.BytesIO()
-            with pd.ExcelWriter(out, engine='openpyxl') as w:
-                g_rows = []
-                for emp in employees:
-                    s = calculate_stats(emp['id'], yr, mo, emp['config_horaires'])
-                    g_rows.append({"Salarié": emp['nom'], "H. Trav": s['total_real'], "Congés": s['nb_conge'], "HS 25%": s['hs_25'], "HS 50%": s['hs_50'], "Reste Payer": s['hs_payable'], "Solde Bq": emp['solde_banque'] + s['delta_bank']})
-                pd.DataFrame(g_rows).to_excel(w, index=False, sheet_name="Global")
-                for emp in employees:
-                    s = calculate_stats(emp['id'], yr, mo, emp['config_horaires'])
-                    name = emp['nom'][:30].replace(":", "")
-                    pd.DataFrame(s['details']).to_excel(w, index=False, sheet_name=name)
-            out.seek(0); st.download_button("⬇️", out, f"Paie_Global_{mo}_{yr}.xlsx")
+        with c_b1.popover("📥"):
+            exp_per = st.selectbox("Période", ["Mois", "Trimestre", "Année", "Plage"])
+            q = (mo - 1) // 3 * 3
+            d_from, d_to = {"Mois": (date(yr, mo, 1),) * 2, "Trimestre": (date(yr, q+1, 1), date(yr, q+3, 1)), "Année": (date(yr, 1, 1), date(yr, 12, 1))}.get(exp_per, (None, None))
+            if exp_per == "Plage":
+                rng = st.date_input("Du / Au", (date(yr, 1, 1), date(yr, mo, 1)))
+                d_from, d_to = (rng[0], rng[-1]) if rng else (date(yr, mo, 1),) * 2
+            exp_fmt = EXPORT_FORMATS[st.radio("Format export", list(EXPORT_FORMATS), horizontal=True)]
+            months = export_months(d_from, d_to)
+            tag = f"{mo}_{yr}" if len(months) == 1 else f"{months[0][1]:02d}-{months[0][0]}_{months[-1][1]:02d}-{months[-1][0]}"
+            # Généré au clic uniquement (données différées). Streamlit garde le fichier entier en mémoire pour le servir :
+            # gros exports (plusieurs mois, tous les salariés) plutôt en tâche de fond
+            st.download_button("⬇️", lambda: export_stream(employees, months, exp_fmt).read(), f"Paie_Global_{tag}." + ("xlsx" if exp_fmt == "xlsx" else "zip"))
+            if st.button("⚙️ En tâche de fond", key="exp_job"): job_submit("export", f"Export {tag} ({exp_fmt})", job_export, employees, months, exp_fmt, tag); st.toast("Export lancé (⚙️ Tâches)")
         if c_b2.button("📄 PDF"):
-            pdf = create_pdf_releve(curr_emp['nom'], f"{mo}/{yr}", stats)
+            pdf = pdf_releve(curr_emp, yr, mo, stats)
             st.download_button("⬇️", pdf, f"Releve_{curr_emp['nom']}.pdf", "application/pdf")
+        with st.popover("📄 Tous"):
+            lot_fmt = st.radio("Format", ["ZIP", "PDF unique"], horizontal=True)
+            if st.button("Générer les relevés"):
+                single = lot_fmt == "PDF unique"
+                with perf_section("pdf"), st.spinner("Rendu des relevés…"): lot = pdf_releves_batch(employees, yr, mo, single)
+                st.download_button("⬇️", lot, f"Releves_{mo:02d}_{yr}." + ("pdf" if single else "zip"), "application/pdf" if single else "application/zip")
+            if st.button("⚙️ En tâche de fond", key="pdf_job"): job_submit("releves", f"Relevés {mo:02d}/{yr}", job_releves, employees, yr, mo, lot_fmt == "PDF unique"); st.toast("Relevés lancés (⚙️ Tâches)")
 
     st.markdown("### 🗓️ Saisie")
     col_fill, col_dummy = st.columns([1, 3])
+    with col_dummy:
+        cf1, cf2 = st.columns(2)
+        fill_per = cf1.radio("Période", ["Mois", "Année"], horizontal=True, label_visibility="collapsed")
+        fill_all = cf2.checkbox("Tous les salariés")
     with col_fill:
         if st.button("✨ Remplir vides"):
-            ld = calendar.monthrange(yr, mo)[1]
-            existing = run_query('SELECT date_pointage FROM pointages WHERE salarie_id=%s AND date_pointage BETWEEN %s AND %s', (curr_emp['id'], f"{yr}-{mo:02d}-01", f"{yr}-{mo:02d}-{ld}"), fetch="all")
-            ex_d = [str(r['date_pointage']) for r in existing] if existing else []
-            days = [date(yr, mo, d) for d in range(1, ld+1)]
-            feries = JoursFeries.for_year(yr)
-            cnt = 0
-            for d in days:
-                iso = d.strftime("%Y-%m-%d")
-                if iso not in ex_d:
-                    ms, me, ads, ae = get_config_for_day(curr_emp['config_horaires'], d)
-                    stat = "Normal"
-                    if feries.get(d): stat = "Normal"
-                    elif d.weekday() == 6: ms=me=ads=ae=None
-                    db_save_pointage(curr_emp['id'], iso, ms, me, ads, ae, stat, "")
-                    cnt+=1
-            st.success(f"{cnt} jours."); st.rerun()
-
-    ld = calendar.monthrange(yr, mo)[1]
-    s, e = f"{yr}-{mo:02d}-01", f"{yr}-{mo:02d}-{ld}"
-    rows = run_query('SELECT * FROM pointages WHERE salarie_id=%s AND date_pointage BETWEEN %s AND %s', (curr_emp['id'], s, e), fetch="all")
-    db_pts = {str(r['date_pointage']): dict(r) for r in rows} if rows else {}
-    days = [date(yr, mo, d) for d in range(1, ld+1)]
-    feries = JoursFeries.for_year(yr)
-    data_list = []
-    for d in days:
-        d_iso, d_fr = d.strftime("%Y-%m-%d"), d.strftime("%d/%m/%Y")
-        row = db_pts.get(d_iso, {})
-        stat = row.get('statut', 'Normal')
-        rms, rme = row.get('m_start'), row.get('m_end')
-        ras, rae = row.get('a_start'), row.get('a_end')
-        cmt = row.get('comment', '')
-        if d_iso not in db_pts: rms=rme=ras=rae=None; stat="Normal"
-        h_real = calc_duree_journee(rms, rme, ras, rae)
-        row_sim = {'statut': stat, 'm_start': rms, 'm_end': rme, 'a_start': ras, 'a_end': rae}
-        nb_tr = 1 if has_ticket_resto(row_sim) else 0
-        is_f = 1 if feries.get(d) else 0
-        is_s = 1 if d.weekday() == 6 else 0
-        if is_f and not cmt: cmt = f"Férié : {feries.get(d)}"
-        data_list.append({"Date": d_fr, "Jour": DAYS_FR[d.weekday()], "Type": stat, "Matin Début": rms, "Matin Fin": rme, "Aprèm Début": ras, "Aprèm Fin": rae, "Total": h_real, "TR": nb_tr, "Commentaire": cmt, "is_ferie": is_f, "is_sun": is_s})
-    df = pd.DataFrame(data_list)
-    gb = GridOptionsBuilder.from_dataframe(df)
-    gb.configure_column("is_ferie", hide=True); gb.configure_column("is_sun", hide=True)
-    gb.configure_column("Date", width=90); gb.configure_column("Jour", width=120); gb.configure_column("Total", width=60); gb.configure_column("TR", width=50)
-    gb.configure_column("Type", editable=True, cellEditor='agSelectCellEditor', cellEditorParams={'values': OPTIONS_STATUT}, width=130)
-    gb.configure_column("Commentaire", editable=True, width=200)
-    for c in ["Matin Début", "Matin Fin", "Aprèm Début", "Aprèm Fin"]: gb.configure_column(c, editable=True, width=90)
-    
-    jscode = JsCode("""function(params) {
-        let style = {'color': 'black', 'background-color': 'white'};
-        if (params.data.is_ferie === 1 || params.data.is_sun === 1) style['background-color'] = '#e0e0e0';
-        if (params.data.Type === 'Arrêt Maladie') style['background-color'] = '#ffb3b3';
-        if (params.data.Type === 'Congé') style['background-color'] = '#b3d9ff';
-        if (params.data.Type === 'Absence Injustifiée') { style['background-color'] = '#ff4d4d'; style['color'] = 'white'; }
-        if (params.data.Type === 'Récupération') style['background-color'] = '#ccffcc';
-        return style;
-    }""")
-    gb.configure_grid_options(getRowStyle=jscode)
-    grid_resp = AgGrid(df, gridOptions=gb.build(), height=500, allow_unsafe_jscode=True, theme='streamlit', update_mode=GridUpdateMode.VALUE_CHANGED)
-    updated_df = pd.DataFrame(grid_resp['data'])
-    if st.button("💾 SAUVEGARDER SAISIE", type="primary"):
-        for i, r in updated_df.iterrows():
-            def cl(v): return v if v and v != "None" and v != "" else None
-            d_obj = dt.strptime(r['Date'], "%d/%m/%Y").strftime("%Y-%m-%d")
-            db_save_pointage(curr_emp['id'], d_obj, cl(r['Matin Début']), cl(r['Matin Fin']), cl(r['Aprèm Début']), cl(r['Aprèm Fin']), r['Type'], r['Commentaire'])
-        st.toast("Sauvegardé !", icon="✅"); st.rerun()
+            d_from, d_to = (date(yr, mo, 1), date(yr, mo, calendar.monthrange(yr, mo)[1])) if fill_per == "Mois" else (date(yr, 1, 1), date(yr, 12, 31))
+            # Année ou tous les salariés : en tâche de fond
+            if fill_per == "Année" or fill_all: job_submit("fill", f"Remplissage {fill_per.lower()} {yr}", job_fill, employees if fill_all else [curr_emp], d_from, d_to); st.toast("Remplissage lancé (⚙️ Tâches)")
+            else:
+                cnt = db_fill_empty([curr_emp], d_from, d_to)
+                if cnt is not None: st.success(f"{cnt} jours."); st.rerun()
+
+    grid_section(curr_emp, yr, mo, grid_frame(curr_emp['id'], curr_emp['config_horaires'], yr, mo))
 
     st.markdown("---")
     c1, c2, c3, c4 = st.columns(4)
@@ -499,12 +674,14 @@ else:
         st.write(f"HS Tot: **{stats['gen_hs_total']:.2f}h**")
         st.write(f"Banked: **-{stats['banked']:.2f}h**")
         st.metric("Reste", f"{stats['hs_payable']:.2f} h")
+        ytd = stats_ytd([curr_emp['id']], yr, mo).get(curr_emp['id'])
+        if ytd: st.caption(f"Cumul {yr} au {mo:02d} : HS {ytd['gen_hs_total']:.2f}h (25% {ytd['hs_25']:.2f} · 50% {ytd['hs_50']:.2f}) · Congés {ytd['nb_conge']} · TR {ytd['total_tr']}")
     with c3:
         st.subheader("🏦 Transfert")
         with st.form("trf"):
             amt = st.number_input("Heures", max_value=float(stats['hs_payable']))
             if st.form_submit_button("Verser"):
-                db_update_banque(curr_emp['id'], amt, f"Transf HS {mo}/{yr}", "Auto")
+                db_update_banque(curr_emp['id'], amt, f"Transf HS {mo}/{yr}", "Auto", periode=(yr, mo), auteur=st.session_state.username)
                 st.rerun()
     with c4:
         st.subheader("📊 Solde / TR")
@@ -513,9 +690,11 @@ else:
         with st.expander("Correction"):
             with st.form("adj"):
                 v = st.number_input("+/-"); m = st.text_input("Motif")
-                if st.form_submit_button("OK"): db_update_banque(curr_emp['id'], v, m); st.rerun()
+                if st.form_submit_button("OK"): db_update_banque(curr_emp['id'], v, m, auteur=st.session_state.username); st.rerun()
 
     st.markdown("---")
     st.caption("Historique Banque")
-    rh = run_query('SELECT * FROM banque_history WHERE salarie_id=%s ORDER BY id DESC', (curr_emp['id'],), fetch="all")
-    if rh: st.dataframe(pd.DataFrame([dict(r) for r in rh]), use_container_width=True)
\ No newline at end of file
+    rh = db_get_banque_history(curr_emp['id'])
+    if rh: st.dataframe(pd.DataFrame([dict(r) for r in rh]), use_container_width=True)
+
+perf_end_rerun()
@@ -0,0 +1,85 @@
+import io
+import json
+import random
+from datetime import date, timedelta
+from psycopg2.extras import execute_values
+
+# Données synthétiques pour les benchmarks : salariés (dont ~30 % en alternance semaine paire / impaire),
+# pointages sur N années (congés en blocs, arrêts maladie, absences, récupérations), mouvements de banque d'heures.
+# Remplace le contenu des tables : à lancer uniquement sur une base de test.
+
+TIMES = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(0, 60, 5)]
+
+def jitter(rng, t, spread=3):
+    # Décale un horaire HH:MM de ±5 min × spread
+    i = TIMES.index(t) + rng.randint(-spread, spread)
+    return TIMES[max(0, min(len(TIMES) - 1, i))]
+
+def week_template(rng, saturday=False):
+    ms, me, ads, ae = rng.choice([("08:00", "12:00", "13:30", "17:00"), ("08:30", "12:00", "14:00", "17:30"), ("09:00", "12:30", "14:00", "18:00")])
+    off = {'ms': None, 'me': None, 'as': None, 'ae': None}
+    wk = [{'ms': ms, 'me': me, 'as': ads, 'ae': ae} for _ in range(5)]
+    return wk + [{'ms': ms, 'me': me, 'as': None, 'ae': None} if saturday else off, off]
+
+def employee_config(rng):
+    paire = week_template(rng)
+    if rng.random() < 0.3: return 1, {'paire': paire, 'impaire': week_template(rng, saturday=True)}
+    return 0, {'paire': paire, 'impaire': paire}
+
+def day_range(d_from, d_to):
+    d = d_from
+    while d <= d_to: yield d; d += timedelta(1)
+
+def employee_rows(rng, s_id, cfg, d_from, d_to):
+    # Une ligne COPY par jour travaillé au planning (ou posé en congé / arrêt)
+    leave = set()
+    for y in range(d_from.year, d_to.year + 1):
+        for _ in range(5):
+            start = date(y, 1, 1) + timedelta(rng.randrange(358))
+            leave.update(start + timedelta(i) for i in range(7))
+    sick, out = 0, []
+    for d in day_range(d_from, d_to):
+        slot = cfg['paire' if d.isocalendar()[1] % 2 == 0 else 'impaire'][d.weekday()]
+        if not slot['ms'] and not slot['as']: continue
+        if sick == 0 and rng.random() < 0.002: sick = rng.randint(2, 15)
+        if sick: sick -= 1; out.append((s_id, d, None, None, None, None, "Arrêt Maladie", "")); continue
+        if d in leave: out.append((s_id, d, None, None, None, None, "Congé", "")); continue
+        r = rng.random()
+        if r < 0.003: out.append((s_id, d, None, None, None, None, "Absence Injustifiée", "")); continue
+        if r < 0.01: out.append((s_id, d, None, None, None, None, "Récupération", "")); continue
+        ms, me, ads, ae = (jitter(rng, v) if v else None for v in (slot['ms'], slot['me'], slot['as'], slot['ae']))
+        out.append((s_id, d, ms, me, ads, ae, "Normal", "RAS" if r > 0.995 else ""))
+    return out
+
+def copy_rows(cur, table, cols, rows):
+    buf = io.StringIO()
+    for r in rows: buf.write("\t".join("\\N" if v is None else str(v) for v in r) + "\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(cols)}) FROM STDIN", buf)
+
+def generate(conn, employees=1000, years=5, end=None, seed=42, chunk=50):
+    # Renvoie le nombre de lignes par table ; banque_mois est à recalculer ensuite (rebuild_banque_ledger)
+    rng = random.Random(seed); end = end or date.today()
+    d_from, d_to = date(end.year - years + 1, 1, 1), end
+    counts = {"users": 0, "salaries": employees, "pointages": 0, "banque_history": 0}
+    with conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE pointages, banque_history, banque_mois, salaries, users RESTART IDENTITY CASCADE")
+        users = [("admin", "admin", 1, 1)] + [(f"rh{i}", f"rh{i}", 0, 1) for i in range(4)] + [("attente", "x", 0, 0)]
+        execute_values(cur, "INSERT INTO users (username, password, is_admin, is_active) VALUES %s", users); counts["users"] = len(users)
+        cfgs = [employee_config(rng) for _ in range(employees)]
+        ids = [r[0] for r in execute_values(cur, "INSERT INTO salaries (nom, mode_alternance, solde_banque, config_horaires, is_archived) VALUES %s RETURNING id",
+                                            [(f"Salarié {i+1:04d}", alt, 0, json.dumps(cfg), 1 if rng.random() < 0.03 else 0) for i, (alt, cfg) in enumerate(cfgs)], fetch=True, page_size=10000)]
+        for i in range(0, employees, chunk):
+            rows = [r for s_id, (_, cfg) in zip(ids[i:i+chunk], cfgs[i:i+chunk]) for r in employee_rows(rng, s_id, cfg, d_from, d_to)]
+            copy_rows(cur, "pointages", ["salarie_id", "date_pointage", "m_start", "m_end", "a_start", "a_end", "statut", "comment"], rows); counts["pointages"] += len(rows)
+        mouv = []
+        for s_id in ids:
+            for y, m in ((y, m) for y in range(d_from.year, d_to.year + 1) for m in range(1, 13) if date(y, m, 1) <= d_to):
+                if rng.random() < 0.25:
+                    mouv.append((s_id, date(y, m, 28), round(rng.uniform(0.5, 8), 2), f"Transf HS {m}/{y}", "Auto", "admin", "HS", y, m))
+                if rng.random() < 0.05:
+                    mouv.append((s_id, date(y, m, 15), -round(rng.uniform(1, 7), 2), "Récupération", "Manuel", "admin", "AJUST", None, None))
+        copy_rows(cur, "banque_history", ["salarie_id", "date_mouv", "montant", "motif", "type_mouv", "auteur", "nature", "periode_annee", "periode_mois"], mouv); counts["banque_history"] = len(mouv)
+        cur.execute("UPDATE salaries s SET solde_banque = b.total FROM (SELECT salarie_id, SUM(montant) AS total FROM banque_history GROUP BY 1) b WHERE b.salarie_id = s.id")
+        cur.execute("ANALYZE")
+    return counts
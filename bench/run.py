@@ -0,0 +1,105 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime as dt
+
+# Benchmarks de l'app sur une base Postgres locale remplie de données synthétiques (gen.py).
+#   python bench/run.py --dsn postgresql://localhost/paie_bench --employees 1000 --years 5 --out bench.json
+#   python bench/run.py --dsn ... --no-generate --compare bench.json     (réutilise les données, compare à un run précédent)
+# La base est VIDÉE puis remplie : ne jamais pointer vers la production.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_core(dsn):
+    # Cœur de l'app (package paie, sans Streamlit) sur la base de bench, schéma à jour
+    sys.path.insert(0, ROOT)
+    import paie
+    paie.connect(dsn, 1, 10); paie.init_db()
+    return paie
+
+def measure(fn, repeat=1):
+    # Durées (s) de repeat appels ; le dernier résultat est renvoyé pour les contrôles
+    times, res = [], None
+    for _ in range(repeat):
+        t = time.perf_counter(); res = fn(); times.append(time.perf_counter() - t)
+    return times, res
+
+def summary(times, **extra):
+    return {"n": len(times), "min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times), "max": max(times), **extra}
+
+def git_rev():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError: return None
+
+def run(core, samples=50, repeat=3, seed=1):
+    rng = random.Random(seed); r = {}
+    emps = core.run_query("SELECT * FROM salaries WHERE is_archived=0 ORDER BY id", fetch="all")
+    last = core.run_query("SELECT max(date_pointage) AS d FROM pointages", fetch="one")['d'] or date.today()
+    months = [(y, m) for y in range(last.year - 1, last.year + 1) for m in range(1, 13) if (y, m) <= (last.year, last.month)]
+    picks = [(rng.choice(emps), *rng.choice(months)) for _ in range(samples)]
+
+    t, _ = measure(lambda: [core.calculate_stats(e['id'], y, m, e['config_horaires']) for e, y, m in picks], repeat)
+    r["calculate_stats"] = summary([x / samples for x in t], unit="s/appel")
+    t, _ = measure(lambda: core.calculate_stats_many([e['id'] for e in emps], last.year, last.month, {e['id']: e['config_horaires'] for e in emps}), repeat)
+    r["calculate_stats_many"] = summary(t, employees=len(emps))
+    t, _ = measure(lambda: [core.grid_frame(e['id'], e['config_horaires'], y, m) for e, y, m in picks], repeat)
+    r["grid_frame"] = summary([x / samples for x in t], unit="s/appel")
+
+    # Sauvegarde : diff grille (horaires du matin décalés sur ~1/3 des jours) puis upsert du mois
+    edits = []
+    for e, y, m in picks[:20]:
+        old = core.grid_frame(e['id'], e['config_horaires'], y, m); new = old.copy()
+        for i in range(0, len(new), 3):
+            v = new.at[i, "Matin Début"]
+            if v: new.at[i, "Matin Début"] = "07:50" if v == "07:55" else "07:55"
+        edits.append((e['id'], new, old))
+    t, _ = measure(lambda: [core.diff_grid(new, old) for _, new, old in edits], repeat)
+    r["save_diff"] = summary([x / len(edits) for x in t], unit="s/mois")
+    chg = [(s_id, core.diff_grid(new, old)) for s_id, new, old in edits]
+    t, n = measure(lambda: sum(core.db_save_pointages_bulk(s_id, rows) for s_id, rows in chg), repeat)
+    r["save_write"] = summary([x / len(chg) for x in t], unit="s/mois", rows=n)
+
+    t, out = measure(lambda: core.export_stream(emps, [(last.year, last.month)], "xlsx").read(), repeat)
+    r["export_xlsx_month"] = summary(t, bytes=len(out), employees=len(emps))
+    t, bk = measure(lambda: core.create_backup_stream().read(), 1)
+    r["backup"] = summary(t, bytes=len(bk))
+    t, _ = measure(lambda: core.restore_backup_json(io.BytesIO(bk)), 1)
+    r["restore"] = summary(t, bytes=len(bk))
+    return r
+
+def compare(new, old_path):
+    old = json.load(open(old_path, encoding="utf-8"))["results"]
+    print(f"{'bench':<24}{'avant':>12}{'après':>12}{'ratio':>8}")
+    for k, v in new.items():
+        if k in old: print(f"{k:<24}{old[k]['median']:>12.4f}{v['median']:>12.4f}{v['median'] / old[k]['median']:>8.2f}")
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks Paie & RH")
+    p.add_argument("--dsn", default=os.environ.get("BENCH_DSN"), required=not os.environ.get("BENCH_DSN"))
+    p.add_argument("--employees", type=int, default=1000); p.add_argument("--years", type=int, default=5)
+    p.add_argument("--seed", type=int, default=42); p.add_argument("--samples", type=int, default=50); p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--no-generate", action="store_true", help="réutiliser les données déjà en base")
+    p.add_argument("--out", default="bench.json"); p.add_argument("--compare", help="résultats précédents (JSON) à comparer")
+    a = p.parse_args()
+    core = load_core(a.dsn)
+    meta = {"date": dt.now().isoformat(timespec="seconds"), "git": git_rev(), "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    if not a.no_generate:
+        import gen, psycopg2
+        conn = psycopg2.connect(a.dsn)
+        t = time.perf_counter(); gen.generate(conn, a.employees, a.years, seed=a.seed); conn.close()
+        core.rebuild_banque_ledger(); meta["generate_s"] = time.perf_counter() - t
+    meta["dataset"] = {k: core.run_query(f"SELECT count(*) AS n FROM {k}", fetch="one")['n'] for k in ["users", "salaries", "pointages", "banque_history"]}
+    res = run(core, a.samples, a.repeat)
+    json.dump({"meta": meta, "results": res}, open(a.out, "w", encoding="utf-8"), indent=2)
+    for k, v in res.items(): print(f"{k:<24}{v['median']:>10.4f} s")
+    if a.compare: compare(res, a.compare)
+
+if __name__ == "__main__":
+    main()
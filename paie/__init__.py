@@ -0,0 +1,32 @@
+import importlib
+
+# Cœur de l'application sans Streamlit : temps de travail, accès Postgres, exports, backup, relevés PDF, miroir local, clôture (CLI).
+# Imports paresseux : « import paie » ne charge rien ; paie.calculate_stats importe paie.donnees (et numpy, psycopg2)
+# au premier accès. pandas, openpyxl, reportlab et pyarrow ne sont importés que par les fonctions qui s'en servent.
+EXPORTS = {
+    "temps": ["DAYS_FR", "OPTIONS_STATUT", "STD_MS", "STD_ME", "STD_AS", "STD_AE", "TIME_COLS", "str_to_time", "time_to_str", "hhmm_to_min", "clean_time",
+              "calc_duree_journee", "has_ticket_resto", "day_arrays", "weekly_hours", "is_even_week", "Schedule", "compile_schedule", "get_config_for_day",
+              "feries_map", "get_default_schedule", "compute_stats", "export_months"],
+    "db": ["configure", "connect", "report", "section", "DB_CONN_ERRORS", "DbPool", "db_conn", "in_transaction", "side_write", "transaction", "sql_tables", "FK_CASCADE", "run_query", "run_values"],
+    "schema": ["MIGRATIONS", "SYNC_TABLES", "schema_version", "init_db", "rebuild_banque_ledger", "is_pointages_partitioned", "ensure_pointages_partitions", "partition_pointages"],
+    "donnees": ["db_upsert_salarie", "db_archive_salarie", "db_restore_salarie", "db_delete_salarie_total", "db_get_salaries", "to_iso", "db_save_pointage", "db_save_pointages_bulk",
+                "build_fill_rows", "db_fill_empty", "db_update_banque", "db_get_transferred_hs_for_month", "db_get_banque_history", "db_get_pointages",
+                "pointage_row", "db_get_pointages_many", "db_get_transferred_hs_many", "calculate_stats", "calculate_stats_many", "GRID_EDIT_COLS", "clean_cell",
+                "diff_grid", "grid_frame", "ROLLUP_COLS", "rollup_row", "rollup_rows", "refresh_monthly_stats", "stats_range", "stats_ytd", "rebuild_monthly_stats"],
+    "exports": ["EXPORT_GLOBAL_COLS", "EXPORT_DETAIL_COLS", "EXPORT_FORMATS", "export_chunks", "export_global_row", "export_sheet_names", "export_xlsx",
+                "export_csv", "export_parquet", "export_stream"],
+    "backup": ["BACKUP_TABLES", "create_backup_stream", "iter_backup", "restore_backup_json"],
+    "releve_pdf": ["create_pdf_releve", "create_pdf_releves", "render_releve", "render_releves"],
+    "miroir": ["Mirror"],
+    "cloture": ["cloture"],
+}
+_WHERE = {n: mod for mod, names in EXPORTS.items() for n in names}
+
+def __getattr__(name):
+    if name in EXPORTS: return importlib.import_module(f"{__name__}.{name}")
+    if name not in _WHERE: raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    v = getattr(importlib.import_module(f"{__name__}.{_WHERE[name]}"), name)
+    globals()[name] = v
+    return v
+
+def __dir__(): return sorted(set(globals()) | set(EXPORTS) | set(_WHERE))
@@ -0,0 +1,103 @@
+import gzip
+import json
+import tempfile
+from datetime import datetime as dt
+from .db import report, run_query, run_values, section, transaction
+from .schema import bump_sync_epoch, rebuild_banque_ledger
+from .temps import TIME_COLS, clean_time
+
+# Backup / restauration de la base.
+# Format .jsonl.gz : 1 ligne d'en-tête, puis par table {"table", "columns"}, les lignes (listes de valeurs), {"end", "rows"}
+BACKUP_TABLES = ["users", "salaries", "pointages", "banque_history"]
+BACKUP_SINCE_TABLES = {"pointages", "banque_history"}
+def create_backup_stream(since=None, chunk=2000, progress=None):
+    # Curseurs serveur + gzip vers un fichier temporaire (RAM jusqu'à 16 Mo, disque au-delà) : mémoire bornée
+    # since : backup incrémental, pointages / mouvements créés ou modifiés depuis le jour since (updated_at, quelle que soit
+    # leur date métier), users & salariés complets. Les suppressions n'y figurent pas : une restauration par fusion les ignore.
+    out = tempfile.SpooledTemporaryFile(max_size=16*1024*1024)
+    with section("backup"), gzip.GzipFile(fileobj=out, mode="wb") as gz, transaction() as conn:
+        def w(o): gz.write(json.dumps(o, default=str, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+        w({"backup": "paie-rh", "version": 2, "created": dt.now().isoformat(timespec="seconds"), "since": str(since) if since else None, "since_col": "updated_at" if since else None})
+        for i, t in enumerate(BACKUP_TABLES):
+            if progress: progress(i / len(BACKUP_TABLES), t)
+            inc = since and t in BACKUP_SINCE_TABLES
+            with conn.cursor(name=f"backup_{t}") as cur:
+                cur.itersize = chunk
+                cur.execute(f"SELECT * FROM {t}" + (" WHERE updated_at >= %s::date" if inc else "") + " ORDER BY 1", (since,) if inc else None)
+                rows, n = cur.fetchmany(chunk), 0
+                w({"table": t, "columns": [c[0] for c in cur.description]})
+                while rows:
+                    for r in rows: w(list(r))
+                    n += len(rows); rows = cur.fetchmany(chunk)
+                w({"end": t, "rows": n})
+    out.seek(0)
+    return out
+def iter_backup(f):
+    # Événements ("header", d) / ("table", t, cols) / ("row", valeurs) : .jsonl.gz lu en flux, ancien JSON chargé d'un bloc
+    magic = f.read(2); f.seek(0)
+    if magic == b"\x1f\x8b":
+        with gzip.GzipFile(fileobj=f) as gz:
+            for line in gz:
+                o = json.loads(line)
+                if isinstance(o, list): yield "row", o
+                elif "table" in o: yield "table", o["table"], o["columns"]
+                elif "backup" in o: yield "header", o
+        return
+    d = json.load(f)
+    yield "header", {"since": None}
+    for t in BACKUP_TABLES:
+        rows = d.get(t) or []
+        if not rows: continue
+        if t == "salaries":
+            for r in rows: r['is_archived'] = r.get('is_archived') or 0
+        cols = list(rows[0].keys())
+        yield "table", t, cols
+        for r in rows: yield "row", [r.get(c) for c in cols]
+
+RESTORE_KEYS = {"users": ["username"], "salaries": ["id"], "pointages": ["salarie_id", "date_pointage"], "banque_history": ["id"]}
+def restore_sql(t, cols, merge):
+    sql = f"INSERT INTO {t} ({', '.join(cols)}) VALUES %s"
+    if not merge: return sql
+    upd = [c for c in cols if c not in RESTORE_KEYS[t]]
+    if t == "banque_history" or not upd: return sql + f" ON CONFLICT ({', '.join(RESTORE_KEYS[t])}) DO NOTHING"
+    return sql + f" ON CONFLICT ({', '.join(RESTORE_KEYS[t])}) DO UPDATE SET " + ", ".join(f"{c}=EXCLUDED.{c}" for c in upd)
+
+def restore_backup_json(f, progress=None, batch=2000, on_error=None):
+    # Tout dans une transaction (TRUNCATE compris) : un échec ne laisse pas de tables à moitié vidées.
+    # Backup incrémental (since) : fusion par clé au lieu de TRUNCATE.
+    f.seek(0, 2); size = f.tell() or 1; f.seek(0)
+    try:
+        with section("restore"), transaction():
+            live = {}
+            for r in run_query("SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()", fetch="all"):
+                live.setdefault(r['table_name'], set()).add(r['column_name'])
+            merge, sql, keep, buf, n = False, None, None, [], 0
+            def flush():
+                nonlocal n
+                if buf: run_values(sql, buf, page_size=batch); n += len(buf); buf.clear()
+                if progress: progress(min(f.tell()/size, 1.0), f"{n} lignes")
+            for ev in iter_backup(f):
+                if ev[0] == "header":
+                    merge = bool(ev[1].get("since"))
+                    if not merge: run_query("TRUNCATE pointages, banque_history, banque_mois, monthly_stats, salaries, users RESTART IDENTITY", fetch="none")
+                elif ev[0] == "table":
+                    flush()
+                    t, cols = ev[1], ev[2]
+                    keep = [i for i, c in enumerate(cols) if c in live.get(t, ()) and not (merge and t == "pointages" and c == "id")]
+                    times = [j for j, i in enumerate(keep) if t == "pointages" and cols[i] in TIME_COLS]
+                    sql = restore_sql(t, [cols[i] for i in keep], merge)
+                else:
+                    row = [ev[1][i] for i in keep]
+                    for j in times: row[j] = clean_time(row[j])
+                    buf.append(row)
+                    if len(buf) >= batch: flush()
+            flush()
+            rebuild_banque_ledger(); run_query("DELETE FROM monthly_stats", fetch="none"); bump_sync_epoch()
+            for t in ("salaries", "pointages", "banque_history"):
+                run_query(f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {t}", fetch="one")
+        if progress: progress(1.0, f"{n} lignes restaurées")
+        return True
+    except Exception as e:
+        if on_error: on_error(f"Err: {e}")
+        else: report(e, f"Err: {e}")
+        return False
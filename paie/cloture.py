@@ -0,0 +1,98 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime as dt
+from .db import connect, run_values, transaction
+from .donnees import ROLLUP_COLS, SQL_UPSERT_ROLLUP, calculate_stats_many, db_get_salaries, rebuild_monthly_stats, rollup_row
+from .exports import EXPORT_FORMATS, export_stream
+from .schema import init_db
+
+# Clôture mensuelle sans Streamlit (cron) : stats du mois de tous les salariés actifs, stockées dans monthly_stats,
+# export paie du mois et relevés PDF. Calcul + rendu répartis par paquets de salariés sur un pool de processus
+# (une connexion par worker) ; l'export est écrit par le processus principal pendant ce temps.
+#   python -m paie cloture 2026-09 --out clotures        -> clotures/2026-09/{Paie_Global_9_2026.xlsx, releves/, cloture.json}
+#   python -m paie cumuls                                  (recalcul complet de monthly_stats)
+# Base : --dsn, sinon $PAIE_DSN, sinon [postgres] url de .streamlit/secrets.toml
+
+def default_dsn(secrets=".streamlit/secrets.toml"):
+    if os.environ.get("PAIE_DSN"): return os.environ["PAIE_DSN"]
+    if os.path.exists(secrets):
+        import tomllib
+        with open(secrets, "rb") as f: return tomllib.load(f).get("postgres", {}).get("url")
+    return None
+
+def previous_month(d):
+    return (d.year - 1, 12) if d.month == 1 else (d.year, d.month - 1)
+
+def parse_month(s):
+    y, m = (int(v) for v in s.split("-"))
+    if not 1 <= m <= 12: raise ValueError(s)
+    return y, m
+
+def releve_name(e, y, m): return f"Releve_{e['nom']}_{e['id']}_{m:02d}_{y}.pdf".replace("/", "-")
+
+def worker_init(dsn): connect(dsn, 1, 1)
+
+def close_chunk(emps, y, m, pdf_dir, keep_stats=False):
+    # Dans un worker : stats du paquet (2 requêtes), lignes monthly_stats, un PDF par salarié si pdf_dir
+    all_st = calculate_stats_many([e['id'] for e in emps], y, m, {e['id']: e['config_horaires'] for e in emps})
+    if pdf_dir:
+        from .releve_pdf import render_releve
+        for e in emps:
+            with open(os.path.join(pdf_dir, releve_name(e, y, m)), "wb") as f: f.write(render_releve((e['nom'], f"{m}/{y}", all_st[e['id']])))
+    return [rollup_row(e['id'], y, m, all_st[e['id']]) for e in emps], (all_st if keep_stats else None)
+
+def cloture(dsn, y, m, out, fmt="xlsx", pdf="fichiers", workers=None, chunk=None, log=print):
+    # pdf : "fichiers" (un PDF par salarié), "unique" (un PDF multi-pages, rendu à la fin), "aucun". Renvoie le résumé écrit dans cloture.json
+    t0 = time.perf_counter(); connect(dsn); init_db()
+    emps = db_get_salaries(0) or []
+    out = os.path.join(out, f"{y}-{m:02d}"); pdf_dir = os.path.join(out, "releves") if pdf == "fichiers" else None
+    os.makedirs(pdf_dir or out, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunk = chunk or max(10, min(200, -(-len(emps) // (workers * 4))))
+    parts = [emps[i:i+chunk] for i in range(0, len(emps), chunk)]
+    log(f"Clôture {m:02d}/{y} : {len(emps)} salarié(s), {len(parts)} paquet(s), {workers} worker(s)")
+    rows, stats = [], {}
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=worker_init, initargs=(dsn,)) as ex:
+        futs = [ex.submit(close_chunk, p, y, m, pdf_dir, pdf == "unique") for p in parts]
+        export = os.path.join(out, f"Paie_Global_{m}_{y}." + ("xlsx" if fmt == "xlsx" else "zip"))
+        with open(export, "wb") as f: f.write(export_stream(emps, [(y, m)], fmt).read())
+        for i, fut in enumerate(futs):
+            r, s = fut.result(); rows += r; stats.update(s or {})
+            log(f"  paquet {i+1}/{len(futs)}")
+    with transaction():
+        if rows: run_values(SQL_UPSERT_ROLLUP, rows, page_size=5000)
+    if pdf == "unique":
+        from .releve_pdf import render_releves
+        with open(os.path.join(out, f"Releves_{m:02d}_{y}.pdf"), "wb") as f: f.write(render_releves([(e['nom'], f"{m}/{y}", stats[e['id']]) for e in emps]))
+    tot = {c: sum(r[3 + i] for r in rows) for i, c in enumerate(ROLLUP_COLS)}
+    res = {"mois": f"{y}-{m:02d}", "date": dt.now().isoformat(timespec="seconds"), "salaries": len(emps), "export": os.path.basename(export),
+           "pdf": pdf, "workers": workers, "duree_s": round(time.perf_counter() - t0, 2), "totaux": tot}
+    with open(os.path.join(out, "cloture.json"), "w", encoding="utf-8") as f: json.dump(res, f, indent=2, ensure_ascii=False)
+    log(f"OK en {res['duree_s']} s -> {out}")
+    return res
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m paie", description="Paie & RH sans interface")
+    p.add_argument("--dsn", default=default_dsn(), help="URL Postgres (défaut : $PAIE_DSN, puis .streamlit/secrets.toml)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("cloture", help="clôture d'un mois : stats, export, relevés")
+    c.add_argument("mois", nargs="?", help="AAAA-MM (défaut : mois précédent)")
+    c.add_argument("--out", default="clotures"); c.add_argument("--format", default="xlsx", choices=sorted(set(EXPORT_FORMATS.values())))
+    c.add_argument("--pdf", default="fichiers", choices=["fichiers", "unique", "aucun"])
+    c.add_argument("--workers", type=int, help="processus (défaut : nb de cœurs)"); c.add_argument("--chunk", type=int, help="salariés par paquet")
+    sub.add_parser("cumuls", help="recalcul complet des cumuls mensuels (monthly_stats)")
+    a = p.parse_args(argv)
+    if not a.dsn: p.error("aucune base : --dsn, $PAIE_DSN ou .streamlit/secrets.toml")
+    if a.cmd == "cloture":
+        try: y, m = parse_month(a.mois) if a.mois else previous_month(date.today())
+        except ValueError: p.error(f"mois invalide : {a.mois} (AAAA-MM)")
+        cloture(a.dsn, y, m, a.out, a.format, a.pdf, a.workers, a.chunk)
+    else:
+        connect(a.dsn); init_db()
+        n, bad = rebuild_monthly_stats()
+        print(f"{n} mois recalculés, {bad} divergeaient")
+    return 0
@@ -0,0 +1,157 @@
+import contextlib
+import re
+import threading
+import time
+import types
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor, execute_values
+
+# Accès Postgres sans Streamlit : pool, transactions, run_query / run_values.
+# L'application branche ses crochets via configure() ; sans eux (CLI, scripts) : pas de cache, erreurs levées.
+#   pool()                  -> DbPool (obligatoire, ou connect(dsn))
+#   on_error(message)       erreur SQL hors transaction (sinon levée)
+#   cache_get(clé) -> (trouvé, résultat), cache_put(clé, résultat), invalidate(tables)   cache des SELECT
+#   on_query(requête, durée, lignes), section(nom) -> context manager                    chronométrage
+#   mirror                  -> paie.miroir.Mirror : lectures / écritures des helpers métier hors transaction
+hooks = types.SimpleNamespace(pool=None, on_error=None, cache_get=None, cache_put=None, invalidate=None, on_query=None, section=None, mirror=None)
+
+def configure(**kw):
+    for k, v in kw.items():
+        if not hasattr(hooks, k): raise TypeError(f"crochet inconnu : {k}")
+        setattr(hooks, k, v)
+
+def connect(dsn, minconn=1, maxconn=4, ping_after=30):
+    # Pool dédié (CLI, workers) : remplace le crochet pool
+    p = DbPool(dsn, minconn, maxconn, ping_after); configure(pool=lambda: p)
+    return p
+
+def report(e, msg=None):
+    # Erreur à signaler hors transaction : message affiché par l'application, ou exception levée à défaut de crochet
+    if hooks.on_error is None: raise e
+    hooks.on_error(msg or f"SQL Error: {e}")
+
+def section(name): return hooks.section(name) if hooks.section else contextlib.nullcontext()
+
+# --- POOL & TRANSACTIONS ---
+DB_CONN_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+_TX = threading.local()
+
+class DbPool:
+    def __init__(self, url, minconn, maxconn, ping_after):
+        self.pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, url)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.ping_after, self.last_used = ping_after, {}
+    def getconn(self, timeout=30):
+        # Attend une connexion libre (ThreadedConnectionPool lève PoolError au lieu d'attendre)
+        if not self.slots.acquire(timeout=timeout): raise pg_pool.PoolError("Pool saturé")
+        try:
+            conn = self.pool.getconn()
+            idle = time.monotonic() - self.last_used.get(id(conn), time.monotonic())
+            if conn.closed or (idle > self.ping_after and not self.is_alive(conn)):
+                self.discard(conn); conn = self.pool.getconn()
+            return conn
+        except Exception: self.slots.release(); raise
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed: self.discard(conn)
+            else: self.last_used[id(conn)] = time.monotonic(); self.pool.putconn(conn)
+        finally: self.slots.release()
+    def discard(self, conn):
+        self.last_used.pop(id(conn), None); self.pool.putconn(conn, close=True)
+    @staticmethod
+    def is_alive(conn):
+        try:
+            with conn.cursor() as c: c.execute("SELECT 1")
+            conn.rollback(); return True
+        except psycopg2.Error: return False
+
+@contextlib.contextmanager
+def db_conn():
+    # Connexion de la transaction en cours, sinon emprunt au pool pour la durée de l'appel
+    conn = getattr(_TX, "conn", None)
+    if conn is not None: yield conn; return
+    p = hooks.pool(); conn = p.getconn(); broken = False
+    try: yield conn
+    except DB_CONN_ERRORS: broken = True; raise
+    finally: p.putconn(conn, broken)
+
+def in_transaction(): return getattr(_TX, "conn", None) is not None
+
+@contextlib.contextmanager
+def side_write():
+    # Écritures hors de la transaction en cours du thread (suivi de progression) : connexion du pool, commit immédiat
+    conn, _TX.conn = getattr(_TX, "conn", None), None
+    try: yield
+    finally: _TX.conn = conn
+
+@contextlib.contextmanager
+def transaction():
+    # Regroupe plusieurs écritures sur une même connexion : commit à la sortie, rollback sur erreur (les erreurs remontent)
+    if getattr(_TX, "conn", None) is not None: yield _TX.conn; return
+    with db_conn() as conn:
+        _TX.conn = conn
+        _TX.touched = set()
+        try: yield conn; conn.commit()
+        except Exception:
+            if not conn.closed: conn.rollback()
+            raise
+        finally: _TX.conn = None; invalidate(_TX.touched)
+
+# --- REQUÊTES ---
+SQL_TABLES = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE|TRUNCATE)\s+((?:\w+\s*,\s*)*\w+)", re.I)
+def sql_tables(q): return {t.strip().lower() for g in SQL_TABLES.findall(q) for t in g.split(",")}
+FK_CASCADE = {"salaries": {"pointages", "banque_history", "banque_mois", "monthly_stats"}}
+
+def invalidate(tables):
+    if tables and hooks.invalidate: hooks.invalidate(tables)
+def touch(query):
+    # Écriture : tables modifiées (et tables liées en cascade) invalidées maintenant, puis à nouveau au commit
+    tables = sql_tables(query)
+    for t in list(tables): tables |= FK_CASCADE.get(t, set())
+    invalidate(tables)
+    if getattr(_TX, "conn", None) is not None: _TX.touched |= tables
+
+def run_query(query, params=None, fetch="all"):
+    in_tx = getattr(_TX, "conn", None) is not None
+    is_read = query.lstrip()[:6].upper() == "SELECT"
+    key = (query, repr(params), fetch) if is_read and fetch != "none" and not in_tx and hooks.cache_get else None
+    if key:
+        found, res = hooks.cache_get(key)
+        if found: return res
+    for retry in (False, True):
+        try:
+            with db_conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+                try:
+                    t0 = time.perf_counter()
+                    cur.execute(query, params)
+                    res = cur.fetchall() if fetch == "all" else cur.fetchone() if fetch == "one" else None
+                    if hooks.on_query: hooks.on_query(query, time.perf_counter() - t0, len(res) if fetch == "all" else int(res is not None) if fetch == "one" else cur.rowcount)
+                    if not in_tx: conn.commit()
+                    break
+                except DB_CONN_ERRORS: raise
+                except Exception:
+                    if not in_tx: conn.rollback()
+                    raise
+        except Exception as e:
+            if in_tx: raise
+            # Connexion perdue : une lecture est rejouée sur une connexion neuve, une écriture est signalée
+            if isinstance(e, DB_CONN_ERRORS) and fetch != "none" and not retry: continue
+            report(e); return None
+    if key and hooks.cache_put: hooks.cache_put(key, res)
+    elif not is_read: touch(query)
+    return res
+
+def run_values(query, rows, template=None, fetch=False, page_size=1000):
+    # INSERT multi-lignes (execute_values) : une seule transaction, un seul commit
+    nested = getattr(_TX, "conn", None) is not None
+    try:
+        with transaction() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            t0 = time.perf_counter()
+            res = execute_values(cur, query, rows, template=template, page_size=page_size, fetch=fetch)
+            if hooks.on_query: hooks.on_query(query, time.perf_counter() - t0, len(rows))
+            touch(query)
+        return res if fetch else len(rows)
+    except Exception as e:
+        if nested: raise
+        report(e); return None
@@ -0,0 +1,247 @@
+import calendar
+import datetime
+import json
+from datetime import date, datetime as dt, timedelta
+from .db import hooks, in_transaction, report, run_query, run_values, transaction
+from .temps import DAYS_FR, TIME_COLS, clean_time, compile_schedule, compute_stats, day_arrays, export_months, feries_map
+
+# Lectures / écritures métier (salariés, pointages, banque d'heures), stats du mois et cumuls mensuels.
+
+# Miroir local (paie.miroir, optionnel) : hors transaction, les lectures db_get_* et les écritures pointages / remplissage /
+# banque passent par la copie SQLite (écritures mises en file, poussées vers Postgres par lots). Les fiches salariés
+# sont écrites directement dans Postgres puis relues par le miroir ; les transactions lisent toujours Postgres.
+def local():
+    mir = hooks.mirror
+    return mir if mir is not None and mir.ready and not in_transaction() else None
+def mirror_refresh():
+    if local(): hooks.mirror.refresh()
+
+# --- FONCTIONS BASE DE DONNEES ---
+def db_upsert_salarie(id_s, nom, mode, sched):
+    j = json.dumps(sched)
+    chk = run_query("SELECT id FROM salaries WHERE nom=%s", (nom,), fetch="one")
+    if chk and (id_s is None or chk['id'] != id_s): return False, "Nom pris."
+    if id_s is None: run_query('INSERT INTO salaries (nom, mode_alternance, config_horaires, is_archived) VALUES (%s,%s,%s,0)', (nom, mode, j), fetch="none")
+    else:
+        # Planning modifié : les cumuls du salarié seront recalculés à la prochaine lecture (même transaction que la fiche)
+        try:
+            with transaction():
+                run_query('UPDATE salaries SET nom=%s, mode_alternance=%s, config_horaires=%s WHERE id=%s', (nom, mode, j, id_s), fetch="none")
+                run_query('DELETE FROM monthly_stats WHERE salarie_id=%s', (id_s,), fetch="none")
+        except Exception as e: report(e); return False, "Erreur."
+    mirror_refresh()
+    return True, "Sauvegardé."
+def db_archive_salarie(s_id): run_query('UPDATE salaries SET is_archived = 1 WHERE id = %s', (s_id,), fetch="none"); mirror_refresh()
+def db_restore_salarie(s_id): run_query('UPDATE salaries SET is_archived = 0 WHERE id = %s', (s_id,), fetch="none"); mirror_refresh()
+def db_delete_salarie_total(s_id): run_query('DELETE FROM salaries WHERE id = %s', (s_id,), fetch="none"); mirror_refresh()
+def db_get_salaries(archived=0):
+    mir = local()
+    if mir: return mir.salaries(archived)
+    return run_query('SELECT * FROM salaries WHERE is_archived=%s ORDER BY id', (archived,), fetch="all")
+def to_iso(d_obj):
+    if isinstance(d_obj, str):
+        try: return dt.strptime(d_obj, "%d/%m/%Y").strftime("%Y-%m-%d")
+        except: return d_obj
+    return d_obj.strftime("%Y-%m-%d")
+SQL_UPSERT_POINTAGE = '''INSERT INTO pointages (salarie_id, date_pointage, m_start, m_end, a_start, a_end, statut, comment) 
+        VALUES %s ON CONFLICT (salarie_id, date_pointage) 
+        DO UPDATE SET m_start=EXCLUDED.m_start, m_end=EXCLUDED.m_end, a_start=EXCLUDED.a_start, a_end=EXCLUDED.a_end, statut=EXCLUDED.statut, comment=EXCLUDED.comment'''
+SQL_FILL_POINTAGES = '''INSERT INTO pointages (salarie_id, date_pointage, m_start, m_end, a_start, a_end, statut, comment) VALUES %s
+        ON CONFLICT (salarie_id, date_pointage) DO NOTHING RETURNING salarie_id, date_pointage, updated_at'''
+def db_save_pointage(s_id, d_obj, ms, me, ads, ae, stat, cmt):
+    db_save_pointages_bulk(s_id, [(d_obj, ms, me, ads, ae, stat, cmt)])
+def db_save_pointages_bulk(s_id, rows):
+    # rows : [(date, ms, me, as, ae, statut, comment)] -> 1 requête, 1 commit (cumuls des mois touchés compris). Renvoie le nb de lignes écrites.
+    if not rows: return 0
+    vals = [(s_id, to_iso(r[0])) + tuple(clean_time(v) for v in r[1:5]) + tuple(r[5:]) for r in rows]
+    mir = local()
+    if mir: return mir.save_pointages(s_id, vals)
+    try:
+        with transaction(): return len(upsert_pointages(s_id, vals))
+    except Exception as e: report(e); return None
+def upsert_pointages(s_id, vals):
+    # Dans la transaction de l'appelant : upsert + cumuls des mois touchés ; renvoie les versions écrites [{date_pointage, updated_at}]
+    res = run_values(SQL_UPSERT_POINTAGE + " RETURNING date_pointage, updated_at", vals, fetch=True)
+    refresh_monthly_stats({(s_id, int(v[1][:4]), int(v[1][5:7])) for v in vals})
+    return res
+def build_fill_rows(emps, d_from, d_to):
+    # Lignes de pré-remplissage (horaires théoriques) : férié = journée Normale au planning, dimanche = vide
+    days = [d_from + timedelta(i) for i in range((d_to - d_from).days + 1)]
+    keys = [(d.strftime("%Y-%m-%d"), d.isocalendar()[1] % 2, d.weekday(), bool(feries_map(d.year).get(d))) for d in days]
+    rows = []
+    for e in emps:
+        sch = compile_schedule(e['config_horaires'])
+        for iso, par, wd, fer in keys:
+            ms, me, ads, ae = sch.slots[par][wd] if fer or wd != 6 else (None, None, None, None)
+            rows.append((e['id'], iso, clean_time(ms), clean_time(me), clean_time(ads), clean_time(ae), "Normal", ""))
+    return rows
+def db_fill_empty(emps, d_from, d_to):
+    # Remplit les jours sans pointage pour N salariés sur une période : INSERT multi-lignes, une transaction, jours existants ignorés
+    rows = build_fill_rows(emps, d_from, d_to)
+    if not rows: return 0
+    mir = local()
+    if mir: return mir.fill_empty(emps, d_from, d_to, rows)
+    try:
+        with transaction(): return len(insert_fill_rows(emps, d_from, d_to, rows))
+    except Exception as e: report(e); return None
+def insert_fill_rows(emps, d_from, d_to, rows):
+    # Dans la transaction de l'appelant ; renvoie les lignes réellement insérées [{salarie_id, date_pointage, updated_at}]
+    res = run_values(SQL_FILL_POINTAGES, rows, fetch=True, page_size=5000)
+    if res: refresh_monthly_stats({(e['id'], y, m) for e in emps for y, m in export_months(d_from, d_to)})
+    return res
+def db_update_banque(s_id, montant, motif, type_mouv="Manuel", periode=None, auteur=None):
+    # periode = (année, mois) pour un transfert d'heures sup, None pour une correction
+    td = date.today().strftime("%Y-%m-%d")
+    mir = local()
+    if mir: return mir.update_banque(s_id, td, montant, motif, type_mouv, periode, auteur)
+    try:
+        with transaction(): write_banque(s_id, td, montant, motif, type_mouv, periode, auteur)
+    except Exception as e: report(e)
+def write_banque(s_id, td, montant, motif, type_mouv, periode, auteur):
+    # Dans la transaction de l'appelant : mouvement, solde, cumul HS du mois et stats du mois
+    y, m = periode or (None, None)
+    run_query('INSERT INTO banque_history (salarie_id, date_mouv, montant, motif, type_mouv, auteur, nature, periode_annee, periode_mois) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)', (s_id, td, montant, motif, type_mouv, auteur, 'HS' if periode else 'AJUST', y, m), fetch="none")
+    run_query('UPDATE salaries SET solde_banque = solde_banque + %s WHERE id = %s', (montant, s_id), fetch="none")
+    if periode:
+        run_query('INSERT INTO banque_mois (salarie_id, annee, mois, total_hs) VALUES (%s,%s,%s,%s) ON CONFLICT (salarie_id, annee, mois) DO UPDATE SET total_hs = banque_mois.total_hs + EXCLUDED.total_hs', (s_id, y, m, montant), fetch="none")
+        refresh_monthly_stats({(s_id, y, m)})
+
+def db_get_transferred_hs_for_month(s_id, y, m):
+    if local(): return db_get_transferred_hs_many([s_id], y, m).get(s_id, 0.0)
+    row = run_query('SELECT total_hs FROM banque_mois WHERE salarie_id=%s AND annee=%s AND mois=%s', (s_id, y, m), fetch="one")
+    return row['total_hs'] if row and row['total_hs'] else 0.0
+
+def db_get_banque_history(s_id):
+    if local(): return local().banque_history(s_id)
+    return run_query('SELECT * FROM banque_history WHERE salarie_id=%s ORDER BY id DESC', (s_id,), fetch="all")
+def db_get_pointages(s_id, y, m):
+    if local(): return local().pointages([s_id], y, m)[s_id]
+    last = calendar.monthrange(y, m)[1]
+    rows = run_query('SELECT * FROM pointages WHERE salarie_id=%s AND date_pointage BETWEEN %s AND %s', (s_id, f"{y}-{m:02d}-01", f"{y}-{m:02d}-{last}"), fetch="all")
+    return {str(r['date_pointage']): pointage_row(r) for r in rows} if rows else {}
+def pointage_row(r):
+    # Colonnes TIME -> "HH:MM" (format attendu par la grille et les calculs)
+    d = dict(r)
+    for c in TIME_COLS:
+        if isinstance(d.get(c), datetime.time): d[c] = d[c].strftime("%H:%M")
+    return d
+
+# --- LECTURES MULTI-SALARIÉS (1 requête pour N salariés) ---
+def db_get_pointages_many(ids, y, m):
+    if local(): return local().pointages(ids, y, m)
+    last = calendar.monthrange(y, m)[1]
+    out = {i: {} for i in ids}
+    rows = run_query('SELECT * FROM pointages WHERE salarie_id = ANY(%s) AND date_pointage BETWEEN %s AND %s', (list(ids), f"{y}-{m:02d}-01", f"{y}-{m:02d}-{last}"), fetch="all")
+    for r in rows or []: out.setdefault(r['salarie_id'], {})[str(r['date_pointage'])] = pointage_row(r)
+    return out
+def db_get_transferred_hs_many(ids, y, m):
+    if local(): return local().transferred_hs(ids, y, m)
+    rows = run_query('SELECT salarie_id, total_hs FROM banque_mois WHERE salarie_id = ANY(%s) AND annee=%s AND mois=%s', (list(ids), y, m), fetch="all")
+    return {r['salarie_id']: (r['total_hs'] if r['total_hs'] else 0.0) for r in rows or []}
+
+# --- CALCUL STATS (HARMONISÉ) ---
+def calculate_stats(sid, y, m, cfg):
+    return compute_stats(db_get_pointages(sid, y, m), db_get_transferred_hs_for_month(sid, y, m), y, m, cfg)
+
+def calculate_stats_many(employee_ids, y, m, cfgs=None):
+    # Stats du mois pour N salariés : 2 requêtes (3 si les configs ne sont pas fournies) au lieu de 2 par salarié
+    ids = list(employee_ids)
+    if not ids: return {}
+    if cfgs is None:
+        rows = run_query('SELECT id, config_horaires FROM salaries WHERE id = ANY(%s)', (ids,), fetch="all")
+        cfgs = {r['id']: r['config_horaires'] for r in rows or []}
+    pts = db_get_pointages_many(ids, y, m)
+    bk = db_get_transferred_hs_many(ids, y, m)
+    return {i: compute_stats(pts.get(i, {}), bk.get(i, 0.0), y, m, cfgs.get(i)) for i in ids}
+
+# --- GRILLE DE SAISIE (données) ---
+GRID_EDIT_COLS = ["Matin Début", "Matin Fin", "Aprèm Début", "Aprèm Fin", "Type", "Commentaire"]
+def clean_cell(v):
+    if v is None or (isinstance(v, float) and v != v): return None
+    v = str(v)
+    return v if v and v != "None" and v != "nan" else None
+def diff_grid(new_df, old_df):
+    # Lignes de la grille modifiées par rapport à l'affichage initial -> [(date, ms, me, as, ae, statut, comment)]
+    old = {r['Date']: tuple(clean_cell(r[c]) for c in GRID_EDIT_COLS) for r in old_df.to_dict("records")}
+    out = []
+    for r in new_df.to_dict("records"):
+        new = tuple(clean_cell(r[c]) for c in GRID_EDIT_COLS)
+        if new != old.get(r['Date']):
+            ms, me, ads, ae, stat, cmt = new
+            out.append((r['Date'], ms, me, ads, ae, stat or "Normal", cmt or ""))
+    return out
+def grid_frame(s_id, cfg, y, m):
+    # Données de la grille de saisie du mois (une ligne par jour) ; pandas importé seulement ici
+    import pandas as pd
+    days = [date(y, m, d) for d in range(1, calendar.monthrange(y, m)[1]+1)]
+    db_pts = db_get_pointages(s_id, y, m); feries = feries_map(y)
+    arr = day_arrays(days, db_pts, cfg)
+    fer = [feries.get(d) for d in days]
+    cmts = [(db_pts.get(d.strftime("%Y-%m-%d")) or {}).get('comment', '') for d in days]
+    return pd.DataFrame({"Date": [d.strftime("%d/%m/%Y") for d in days], "Jour": [DAYS_FR[d.weekday()] for d in days], "Type": arr["statut"],
+                         "Matin Début": arr["m_start"], "Matin Fin": arr["m_end"], "Aprèm Début": arr["a_start"], "Aprèm Fin": arr["a_end"],
+                         "Total": arr["hr"], "TR": arr["tr"].astype(int), "Commentaire": [c if c or not f else f"Férié : {f}" for c, f in zip(cmts, fer)],
+                         "is_ferie": [1 if f else 0 for f in fer], "is_sun": [1 if d.weekday() == 6 else 0 for d in days]})
+
+# --- CUMULS MENSUELS ---
+# monthly_stats : résultat de calculate_stats matérialisé par (salarié, mois). Recalculé dans la transaction de chaque écriture
+# qui touche le mois (saisie, remplissage, transfert HS) ; effacé au changement de planning et à la restauration, puis
+# recalculé à la première lecture. stats_range / stats_ytd : cumuls multi-mois sans relire les pointages.
+ROLLUP_COLS = ["total_real", "total_tr", "nb_conge", "nb_maladie", "nb_abs", "gen_hs_total", "hs_25", "hs_50", "banked", "hs_payable", "delta_bank"]
+SQL_UPSERT_ROLLUP = f'''INSERT INTO monthly_stats (salarie_id, annee, mois, {", ".join(ROLLUP_COLS)}, weekly) VALUES %s
+    ON CONFLICT (salarie_id, annee, mois) DO UPDATE SET {", ".join(f"{c}=EXCLUDED.{c}" for c in ROLLUP_COLS + ["weekly"])}, computed_at=now()'''
+
+def rollup_row(s_id, y, m, s): return (s_id, y, m, *(s[c] for c in ROLLUP_COLS), json.dumps(s['weekly']))
+def rollup_rows(keys):
+    # keys : {(salarié, année, mois)} -> lignes monthly_stats, calculées mois par mois via calculate_stats_many
+    by_month = {}
+    for s_id, y, m in keys: by_month.setdefault((y, m), []).append(s_id)
+    rows = []
+    for (y, m), ids in sorted(by_month.items()):
+        all_st = calculate_stats_many(ids, y, m)
+        rows += [rollup_row(i, y, m, all_st[i]) for i in ids]
+    return rows
+def refresh_monthly_stats(keys):
+    # Calcul et écriture dans une même transaction : stats lues dans Postgres (jamais dans le miroir local)
+    nested = in_transaction()
+    try:
+        with transaction():
+            rows = rollup_rows(keys)
+            return run_values(SQL_UPSERT_ROLLUP, rows) if rows else 0
+    except Exception as e:
+        if nested: raise
+        report(e); return None
+
+def stats_range(ids, months):
+    # {salarié: cumuls des ROLLUP_COLS, "weekly" (heures par semaine ISO), "months" {(année, mois): ligne}} ; mois manquants calculés et stockés
+    ids, months = list(ids), sorted(set(months))
+    if not ids or not months: return {}
+    q = 'SELECT * FROM monthly_stats WHERE salarie_id = ANY(%s) AND annee * 100 + mois BETWEEN %s AND %s'
+    args = (ids, months[0][0] * 100 + months[0][1], months[-1][0] * 100 + months[-1][1])
+    have = {(r['salarie_id'], r['annee'], r['mois']): r for r in run_query(q, args, fetch="all") or []}
+    missing = {(i, y, m) for i in ids for y, m in months if (i, y, m) not in have}
+    if missing and refresh_monthly_stats(missing) is not None:
+        have = {(r['salarie_id'], r['annee'], r['mois']): r for r in run_query(q, args, fetch="all") or []}
+    out = {}
+    for i in ids:
+        rs = {(y, m): have[(i, y, m)] for y, m in months if (i, y, m) in have}
+        tot = {c: sum(r[c] for r in rs.values()) for c in ROLLUP_COLS}; wk = {}
+        for r in rs.values():
+            for k, h in json.loads(r['weekly'] or "{}").items(): wk[k] = wk.get(k, 0) + h
+        out[i] = tot | {"weekly": wk, "months": rs}
+    return out
+def stats_ytd(ids, y, m): return stats_range(ids, export_months(date(y, 1, 1), date(y, m, 1)))
+
+def rebuild_monthly_stats():
+    # Recalcul complet des (salarié, mois) ayant des pointages ou des transferts HS ; renvoie (mois recalculés, mois qui divergeaient)
+    keys = {(r['salarie_id'], r['annee'], r['mois']) for r in run_query('''SELECT DISTINCT salarie_id, EXTRACT(YEAR FROM date_pointage)::int AS annee, EXTRACT(MONTH FROM date_pointage)::int AS mois
+        FROM pointages UNION SELECT salarie_id, annee, mois FROM banque_mois''', fetch="all") or []}
+    old = {(r['salarie_id'], r['annee'], r['mois']): r for r in run_query("SELECT * FROM monthly_stats", fetch="all") or []}
+    try:
+        with transaction():
+            rows = rollup_rows(keys)
+            bad = sum(1 for r in rows if r[:3] in old and (any(abs((old[r[:3]][c] or 0) - v) > 1e-6 for c, v in zip(ROLLUP_COLS, r[3:-1])) or old[r[:3]]['weekly'] != r[-1]))
+            run_query("DELETE FROM monthly_stats", fetch="none")
+            if rows: run_values(SQL_UPSERT_ROLLUP, rows, page_size=5000)
+    except Exception as e: report(e); return None
+    return len(rows), bad
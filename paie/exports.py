@@ -0,0 +1,90 @@
+import csv
+import importlib.util
+import io
+import re
+import shutil
+import tempfile
+import zipfile
+from .db import section, transaction
+from .donnees import calculate_stats_many
+
+# Export paie en flux : paquets de salariés × mois via calculate_stats_many, écrits au fil de l'eau dans un fichier
+# temporaire (classeur openpyxl write_only, CSV ou Parquet zippés) : mémoire bornée par un paquet, pas par le volume total.
+EXPORT_GLOBAL_COLS = ["Salarié", "Période", "H. Trav", "Congés", "HS 25%", "HS 50%", "Reste Payer", "Solde Bq"]
+EXPORT_DETAIL_COLS = ["Date", "Jour", "Statut", "Matin", "Aprem", "Heures"]
+EXPORT_FORMATS = {"Excel": "xlsx", "CSV": "csv"} | ({"Parquet": "parquet"} if importlib.util.find_spec("pyarrow") else {})
+
+def export_chunks(emps, months, chunk=100, progress=None):
+    # Paquets de salariés, chacun avec un générateur (période, stats du paquet) mois par mois
+    steps, done = max(1, len(months) * -(-len(emps) // chunk)), 0
+    def per_month(part, cfgs):
+        nonlocal done
+        for y, m in months:
+            yield f"{m:02d}/{y}", calculate_stats_many(list(cfgs), y, m, cfgs)
+            done += 1
+            if progress: progress(done / steps, f"{done}/{steps}")
+    for i in range(0, len(emps), chunk):
+        part = emps[i:i+chunk]
+        yield part, per_month(part, {e['id']: e['config_horaires'] for e in part})
+
+def export_global_row(e, per, s): return [e['nom'], per, s['total_real'], s['nb_conge'], s['hs_25'], s['hs_50'], s['hs_payable'], e['solde_banque'] + s['delta_bank']]
+
+def export_sheet_names(emps):
+    # Noms d'onglet Excel : 31 car. max, sans []:*?/\, uniques
+    names, seen = {}, {"Global"}
+    for e in emps:
+        n = re.sub(r"[\[\]:*?/\\]", "", e['nom'])[:30] or str(e['id'])
+        if n in seen: n = f"{n[:29-len(str(e['id']))]}_{e['id']}"
+        seen.add(n); names[e['id']] = n
+    return names
+
+def export_xlsx(out, emps, months, chunk, progress=None):
+    # Un onglet par salarié, fermé (écrit sur disque) dès que son paquet est terminé
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True); g = wb.create_sheet("Global"); g.append(EXPORT_GLOBAL_COLS); names = export_sheet_names(emps)
+    for part, per_stats in export_chunks(emps, months, chunk, progress):
+        sh = {e['id']: wb.create_sheet(names[e['id']]) for e in part}
+        for ws in sh.values(): ws.append(EXPORT_DETAIL_COLS)
+        for per, all_st in per_stats:
+            for e in part:
+                s = all_st[e['id']]; g.append(export_global_row(e, per, s))
+                for r in s['details']: sh[e['id']].append([r[c] for c in EXPORT_DETAIL_COLS])
+        for ws in sh.values(): ws.close()
+    wb.save(out)
+
+def export_csv(out, emps, months, chunk, progress=None):
+    # ZIP : details.csv écrit directement dans l'archive, global.csv via un fichier temporaire
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z, tempfile.TemporaryFile("w+", newline="", encoding="utf-8") as gf:
+        gw = csv.writer(gf); gw.writerow(EXPORT_GLOBAL_COLS)
+        with io.TextIOWrapper(z.open("details.csv", "w"), encoding="utf-8", newline="") as f:
+            dw = csv.writer(f); dw.writerow(["Salarié", "Période"] + EXPORT_DETAIL_COLS)
+            for part, per_stats in export_chunks(emps, months, chunk, progress):
+                for per, all_st in per_stats:
+                    for e in part:
+                        s = all_st[e['id']]; gw.writerow(export_global_row(e, per, s))
+                        dw.writerows([e['nom'], per] + [r[c] for c in EXPORT_DETAIL_COLS] for r in s['details'])
+        gf.seek(0)
+        with io.TextIOWrapper(z.open("global.csv", "w"), encoding="utf-8", newline="") as f:
+            for line in gf: f.write(line)
+
+def export_parquet(out, emps, months, chunk, progress=None):
+    # Même découpage que le CSV ; un row group par (paquet, mois). pyarrow optionnel, importé seulement ici
+    import pyarrow as pa, pyarrow.parquet as pq
+    num = [pa.float64()] * 6; num[1] = pa.int64()
+    g_schema = pa.schema([(c, t) for c, t in zip(EXPORT_GLOBAL_COLS, [pa.string()] * 2 + num)])
+    d_schema = pa.schema([(c, pa.string()) for c in ["Salarié", "Période"] + EXPORT_DETAIL_COLS[:-1]] + [("Heures", pa.float64())])
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z, tempfile.TemporaryFile() as gf:
+        with pq.ParquetWriter(gf, g_schema) as gw, z.open("details.parquet", "w") as f, pq.ParquetWriter(f, d_schema) as dw:
+            for part, per_stats in export_chunks(emps, months, chunk, progress):
+                for per, all_st in per_stats:
+                    gw.write_table(pa.Table.from_pylist([dict(zip(EXPORT_GLOBAL_COLS, export_global_row(e, per, all_st[e['id']]))) for e in part], g_schema))
+                    dw.write_table(pa.Table.from_pylist([{"Salarié": e['nom'], "Période": per, **r} for e in part for r in all_st[e['id']]['details']], d_schema))
+        gf.seek(0)
+        with z.open("global.parquet", "w") as f: shutil.copyfileobj(gf, f)
+
+def export_stream(emps, months, fmt="xlsx", chunk=100, progress=None):
+    # Une transaction : instantané cohérent, une seule connexion, et lectures hors cache (rien n'est retenu d'un paquet à l'autre)
+    out = tempfile.SpooledTemporaryFile(max_size=16*1024*1024)
+    with section("export"), transaction(): {"xlsx": export_xlsx, "csv": export_csv, "parquet": export_parquet}[fmt](out, emps, months, chunk, progress)
+    out.seek(0)
+    return out
@@ -0,0 +1,273 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime as dt
+from psycopg2 import pool as pg_pool
+from .db import DB_CONN_ERRORS, run_query, transaction
+from .donnees import build_fill_rows, insert_fill_rows, upsert_pointages, write_banque
+
+# Miroir local optionnel : copie SQLite (fichier local) de salaries, pointages et banque_history pour une base distante.
+# - Lectures des helpers (db_get_*, calculate_stats, grille) servies localement, sans aller-retour réseau.
+# - Écritures (saisie, remplissage, banque) appliquées localement puis mises en file (outbox) ; un thread les pousse
+#   vers Postgres par lots puis relit les lignes modifiées depuis la synchro précédente (updated_at, migration 8).
+#   Base injoignable : la saisie continue, la file est rejouée au retour de la connexion.
+# - Conflit : un pointage (salarié, jour) modifié dans Postgres depuis la version lue localement n'est pas écrasé ;
+#   la saisie locale est gardée dans conflicts, la version distante reprend sa place, à trancher depuis l'app.
+# - sync_epoch changé (restauration, partitionnement) : rechargement complet.
+MIRROR_COLS = {
+    "salaries": ["id", "nom", "mode_alternance", "solde_banque", "config_horaires", "is_archived", "updated_at"],
+    "pointages": ["salarie_id", "date_pointage", "m_start", "m_end", "a_start", "a_end", "statut", "comment", "updated_at"],
+    "banque_history": ["id", "salarie_id", "date_mouv", "montant", "motif", "type_mouv", "auteur", "nature", "periode_annee", "periode_mois", "updated_at"]}
+POINTAGE_VALS = ["m_start", "m_end", "a_start", "a_end", "statut", "comment"]
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS salaries (id INTEGER PRIMARY KEY, nom TEXT, mode_alternance INTEGER, solde_banque REAL, config_horaires TEXT, is_archived INTEGER, updated_at TEXT);
+CREATE TABLE IF NOT EXISTS pointages (salarie_id INTEGER, date_pointage TEXT, m_start TEXT, m_end TEXT, a_start TEXT, a_end TEXT, statut TEXT, comment TEXT,
+    updated_at TEXT, pending INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (salarie_id, date_pointage));
+CREATE TABLE IF NOT EXISTS banque_history (id INTEGER PRIMARY KEY, salarie_id INTEGER, date_mouv TEXT, montant REAL, motif TEXT, type_mouv TEXT, auteur TEXT,
+    nature TEXT, periode_annee INTEGER, periode_mois INTEGER, updated_at TEXT);
+CREATE INDEX IF NOT EXISTS idx_banque_salarie ON banque_history (salarie_id, periode_annee, periode_mois);
+CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, payload TEXT NOT NULL, created_at TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT);
+CREATE TABLE IF NOT EXISTS conflicts (id INTEGER PRIMARY KEY AUTOINCREMENT, salarie_id INTEGER, date_pointage TEXT, local TEXT, remote TEXT, detected_at TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Pointages en attente d'envoi (pending > 0) : jamais écrasés par la synchro
+LOCAL_UPSERT = {
+    "salaries": f"INSERT OR REPLACE INTO salaries ({', '.join(MIRROR_COLS['salaries'])}) VALUES ({', '.join('?' * len(MIRROR_COLS['salaries']))})",
+    "pointages": f"""INSERT INTO pointages ({', '.join(MIRROR_COLS['pointages'])}) VALUES ({', '.join('?' * len(MIRROR_COLS['pointages']))})
+        ON CONFLICT (salarie_id, date_pointage) DO UPDATE SET {', '.join(f"{c}=excluded.{c}" for c in POINTAGE_VALS + ['updated_at'])} WHERE pointages.pending = 0""",
+    "banque_history": f"INSERT OR REPLACE INTO banque_history ({', '.join(MIRROR_COLS['banque_history'])}) VALUES ({', '.join('?' * len(MIRROR_COLS['banque_history']))})"}
+MAX_ATTEMPTS = 5
+
+def local_value(v):
+    # Valeurs Postgres -> SQLite : TIME en "HH:MM" (comme pointage_row), dates et horodatages en texte
+    if isinstance(v, datetime.time): return v.strftime("%H:%M")
+    if isinstance(v, date): return str(v)
+    return v
+
+def describe(p):
+    # Pointage (dict) -> "08:30-12:00 / 14:00-17:30 Normal"
+    if not p: return "—"
+    return " / ".join(f"{s}-{e}" for s, e in ((p.get('m_start'), p.get('m_end')), (p.get('a_start'), p.get('a_end'))) if s or e) + f" {p.get('statut') or ''}" + (f" ({p['comment']})" if p.get('comment') else "")
+
+class Mirror:
+    def __init__(self, path, overlap=300, batch=200):
+        # overlap (s) : marge de relecture sous la dernière synchro (transactions encore ouvertes à ce moment-là)
+        self.path, self.overlap, self.batch = path, overlap, batch
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(LOCAL_SCHEMA)
+        self.lock, self.sync_lock, self.wake = threading.RLock(), threading.RLock(), threading.Event()
+        self.ready = self.meta("epoch") is not None
+        self.error, self.thread = None, None
+
+    # --- BASE LOCALE ---
+    def q(self, sql, args=()):
+        with self.lock: return [dict(r) for r in self.db.execute(sql, args)]
+    def meta(self, key):
+        r = self.q("SELECT value FROM meta WHERE key = ?", (key,))
+        return r[0]['value'] if r else None
+    def set_meta(self, key, value): self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    def enqueue(self, op, payload):
+        # Dans la transaction SQLite de l'écriture locale : l'écriture et son entrée de file sont atomiques
+        return self.db.execute("INSERT INTO outbox (op, payload, created_at) VALUES (?, ?, ?)", (op, json.dumps(payload), dt.now().isoformat(timespec="seconds"))).lastrowid
+
+    # --- LECTURES ---
+    def salaries(self, archived=0): return self.q("SELECT * FROM salaries WHERE is_archived = ? ORDER BY id", (archived,))
+    def pointages(self, ids, y, m):
+        out = {i: {} for i in ids}
+        for r in self.q("SELECT * FROM pointages WHERE salarie_id IN (SELECT value FROM json_each(?)) AND date_pointage BETWEEN ? AND ?",
+                        (json.dumps(list(ids)), f"{y}-{m:02d}-01", f"{y}-{m:02d}-31")):
+            out.setdefault(r['salarie_id'], {})[r['date_pointage']] = r
+        return out
+    def transferred_hs(self, ids, y, m):
+        rows = self.q("""SELECT salarie_id, SUM(montant) AS total FROM banque_history WHERE nature = 'HS' AND periode_annee = ? AND periode_mois = ?
+            AND salarie_id IN (SELECT value FROM json_each(?)) GROUP BY salarie_id""", (y, m, json.dumps(list(ids))))
+        return {r['salarie_id']: r['total'] or 0.0 for r in rows}
+    def banque_history(self, s_id):
+        # Mouvements pas encore envoyés (id négatifs) en tête, comme les plus récents
+        return self.q("SELECT * FROM banque_history WHERE salarie_id = ? ORDER BY id < 0 DESC, abs(id) DESC", (s_id,))
+
+    # --- ÉCRITURES LOCALES (mises en file) ---
+    def save_pointages(self, s_id, vals):
+        # vals : [(salarié, date iso, ms, me, as, ae, statut, comment)]
+        with self.lock, self.db:
+            self.db.executemany(f"""INSERT INTO pointages (salarie_id, date_pointage, {', '.join(POINTAGE_VALS)}, pending) VALUES (?,?,?,?,?,?,?,?,1)
+                ON CONFLICT (salarie_id, date_pointage) DO UPDATE SET {', '.join(f"{c}=excluded.{c}" for c in POINTAGE_VALS)}, pending = pending + 1""", vals)
+            self.enqueue("pointages", {"s": s_id, "rows": [list(v[1:]) for v in vals]})
+        self.wake.set()
+        return len(vals)
+    def fill_empty(self, emps, d_from, d_to, rows):
+        with self.lock, self.db:
+            n = self.db.executemany(f"INSERT OR IGNORE INTO pointages (salarie_id, date_pointage, {', '.join(POINTAGE_VALS)}) VALUES (?,?,?,?,?,?,?,?)", rows).rowcount
+            self.enqueue("fill", {"emps": [{"id": e['id'], "config_horaires": e['config_horaires']} for e in emps], "from": str(d_from), "to": str(d_to)})
+        self.wake.set()
+        return n
+    def update_banque(self, s_id, td, montant, motif, type_mouv, periode, auteur):
+        y, m = periode or (None, None)
+        with self.lock, self.db:
+            oid = self.enqueue("banque", {"s": s_id, "date": td, "montant": montant, "motif": motif, "type": type_mouv, "periode": periode, "auteur": auteur})
+            self.db.execute("INSERT INTO banque_history (id, salarie_id, date_mouv, montant, motif, type_mouv, auteur, nature, periode_annee, periode_mois) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                            (-oid, s_id, td, montant, motif, type_mouv, auteur, 'HS' if periode else 'AJUST', y, m))
+            self.db.execute("UPDATE salaries SET solde_banque = solde_banque + ? WHERE id = ?", (montant, s_id))
+        self.wake.set()
+
+    # --- ENVOI (outbox -> Postgres) ---
+    def push(self):
+        # Un lot = une transaction Postgres. Lot refusé (hors coupure réseau) : rejoué entrée par entrée pour isoler la fautive,
+        # qui est mise de côté après MAX_ATTEMPTS essais. Renvoie le nombre d'entrées envoyées.
+        with self.sync_lock:
+            todo = self.q("SELECT * FROM outbox WHERE attempts < ? ORDER BY id LIMIT ?", (MAX_ATTEMPTS, self.batch))
+            if not todo: return 0
+            try:
+                # written : versions posées plus tôt dans ce lot, (salarié, jour) -> updated_at ; la base SQLite n'est à jour qu'après le commit
+                done, written = [], {}
+                with transaction():
+                    for e in todo:
+                        res = self.apply(e, written); done.append((e, res))
+                        written.update({(s, d): v for s, d, v in res.get('versions', [])})
+            except Exception as ex:
+                if is_outage(ex): raise
+                n = 0
+                for e in todo:
+                    try:
+                        with transaction(): res = self.apply(e, {})
+                    except Exception as ex:
+                        if is_outage(ex): raise
+                        with self.lock, self.db: self.db.execute("UPDATE outbox SET attempts = attempts + 1, error = ? WHERE id = ?", (str(ex)[:500], e['id']))
+                        continue
+                    with self.lock, self.db: self.settle(e, res)
+                    n += 1
+                return n
+            with self.lock, self.db:
+                for e, res in done: self.settle(e, res)
+            return len(done)
+
+    def apply(self, e, written):
+        # Rejoue une entrée dans la transaction Postgres en cours ; renvoie ce qu'il faut reporter dans la base locale
+        p = json.loads(e['payload'])
+        if e['op'] == "pointages": return self.apply_pointages(p, written)
+        if e['op'] == "fill":
+            d_from, d_to = date.fromisoformat(p['from']), date.fromisoformat(p['to'])
+            res = insert_fill_rows(p['emps'], d_from, d_to, build_fill_rows(p['emps'], d_from, d_to))
+            return {"versions": [(r['salarie_id'], local_value(r['date_pointage']), local_value(r['updated_at'])) for r in res or []]}
+        write_banque(p['s'], p['date'], p['montant'], p['motif'], p['type'], p['periode'], p['auteur'])
+        return {}
+
+    def apply_pointages(self, p, written):
+        # Verrou sur les lignes distantes ; version distante différente de celle lue localement (ou écrite plus tôt dans le lot)
+        # et valeurs différentes = conflit
+        s_id, rows = p['s'], p['rows']
+        dates = [r[0] for r in rows]
+        base = {r['date_pointage']: written.get((s_id, r['date_pointage']), r['updated_at']) for r in self.q("SELECT date_pointage, updated_at FROM pointages WHERE salarie_id = ? AND date_pointage IN (SELECT value FROM json_each(?))", (s_id, json.dumps(dates)))}
+        remote = {local_value(r['date_pointage']): {c: local_value(r[c]) for c in POINTAGE_VALS + ["updated_at"]} for r in run_query(
+            f"SELECT date_pointage, {', '.join(POINTAGE_VALS)}, updated_at FROM pointages WHERE salarie_id = %s AND date_pointage = ANY(%s::date[]) FOR UPDATE", (s_id, dates), fetch="all")}
+        keep, clash = [], []
+        for r in rows:
+            cur, mine = remote.get(r[0]), dict(zip(POINTAGE_VALS, r[1:]))
+            if cur and not p.get('force') and cur['updated_at'] != base.get(r[0]) and {c: cur[c] for c in POINTAGE_VALS} != mine: clash.append((r[0], mine, cur))
+            else: keep.append((s_id, *r))
+        res = upsert_pointages(s_id, keep) if keep else []
+        return {"versions": [(s_id, local_value(r['date_pointage']), local_value(r['updated_at'])) for r in res], "clash": clash, "s": s_id}
+
+    def settle(self, e, res):
+        # Après commit Postgres, dans la transaction SQLite : versions reçues, conflits, entrée retirée de la file
+        now = dt.now().isoformat(timespec="seconds")
+        if e['op'] == "pointages":
+            self.db.executemany("UPDATE pointages SET updated_at = ?, pending = max(pending - 1, 0) WHERE salarie_id = ? AND date_pointage = ?", [(v, s, d) for s, d, v in res['versions']])
+            for d, mine, theirs in res['clash']:
+                # Saisie plus récente sur le même jour : remplace le conflit précédent
+                self.db.execute("DELETE FROM conflicts WHERE salarie_id = ? AND date_pointage = ?", (res['s'], d))
+                self.db.execute("INSERT INTO conflicts (salarie_id, date_pointage, local, remote, detected_at) VALUES (?,?,?,?,?)", (res['s'], d, json.dumps(mine), json.dumps(theirs), now))
+                self.db.execute(f"UPDATE pointages SET {', '.join(f'{c} = ?' for c in POINTAGE_VALS)}, updated_at = ?, pending = max(pending - 1, 0) WHERE salarie_id = ? AND date_pointage = ?",
+                                [theirs[c] for c in POINTAGE_VALS] + [theirs['updated_at'], res['s'], d])
+        elif e['op'] == "fill":
+            self.db.executemany("UPDATE pointages SET updated_at = ? WHERE salarie_id = ? AND date_pointage = ? AND updated_at IS NULL", [(v, s, d) for s, d, v in res['versions']])
+        else: self.db.execute("DELETE FROM banque_history WHERE id = ?", (-e['id'],))
+        self.db.execute("DELETE FROM outbox WHERE id = ?", (e['id'],))
+
+    # --- SYNCHRO (Postgres -> local) ---
+    def pull(self):
+        # Lignes modifiées depuis la dernière synchro (moins overlap), ou tout si sync_epoch a changé. Renvoie le nb de lignes lues.
+        with self.sync_lock, transaction() as conn:
+            epoch = local_value(run_query("SELECT epoch FROM sync_epoch WHERE id = 1", fetch="one")['epoch'])
+            start = local_value(run_query("SELECT now() AS t", fetch="one")['t'])
+            full = epoch != self.meta("epoch")
+            since = None if full else self.meta("since")
+            ids = [r['id'] for r in run_query("SELECT id FROM salaries", fetch="all")]
+            data = {t: fetch_changes(conn, t, cols, since, self.overlap) for t, cols in MIRROR_COLS.items()}
+            if full: self.ready = False
+            else: data = {t: list(g) for t, g in data.items()}
+            n = 0
+            with self.lock, self.db:
+                if full:
+                    self.db.execute("DELETE FROM salaries"); self.db.execute("DELETE FROM pointages WHERE pending = 0"); self.db.execute("DELETE FROM banque_history WHERE id > 0")
+                for t, batches in data.items():
+                    for rows in batches: self.db.executemany(LOCAL_UPSERT[t], [[local_value(v) for v in r] for r in rows]); n += len(rows)
+                for t, col in (("salaries", "id"), ("pointages", "salarie_id"), ("banque_history", "salarie_id")):
+                    self.db.execute(f"DELETE FROM {t} WHERE {col} NOT IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+                self.set_meta("epoch", epoch); self.set_meta("since", start); self.set_meta("last_sync", dt.now().isoformat(timespec="seconds"))
+            self.ready = True
+            return n
+
+    def refresh(self):
+        # Relecture immédiate (après une écriture directe dans Postgres) ; échec laissé au thread de synchro
+        try: self.pull()
+        except Exception as e: self.error = f"{dt.now():%H:%M:%S} {e}"
+
+    def cycle(self):
+        # Envoi de toute la file (par lots) puis relecture ; erreur gardée pour l'affichage, nouvel essai au cycle suivant
+        try:
+            while self.push() == self.batch: pass
+            self.pull(); self.error = None
+        except Exception as e: self.error = f"{dt.now():%H:%M:%S} {e}"
+
+    def start(self, every=15, delay=2):
+        # Thread de synchro : un cycle toutes les every s, ou delay s après une écriture locale (saisies rapprochées groupées)
+        if self.thread: return self
+        def loop():
+            while True:
+                self.cycle()
+                if self.wake.wait(every): time.sleep(delay)
+                self.wake.clear()
+        self.thread = threading.Thread(target=loop, name="paie-miroir", daemon=True); self.thread.start()
+        return self
+
+    # --- ÉTAT & CONFLITS ---
+    def status(self):
+        r = self.q(f"""SELECT (SELECT count(*) FROM outbox WHERE attempts < {MAX_ATTEMPTS}) AS pending, (SELECT count(*) FROM outbox WHERE attempts >= {MAX_ATTEMPTS}) AS failed,
+            (SELECT count(*) FROM conflicts) AS conflicts""")[0]
+        return r | {"last_sync": self.meta("last_sync"), "ready": self.ready, "error": self.error}
+    def conflicts(self):
+        rows = self.q("SELECT c.*, s.nom FROM conflicts c LEFT JOIN salaries s ON s.id = c.salarie_id ORDER BY c.id")
+        return [r | {"local": json.loads(r['local']), "remote": json.loads(r['remote'])} for r in rows]
+    def failed(self): return self.q("SELECT * FROM outbox WHERE attempts >= ? ORDER BY id", (MAX_ATTEMPTS,))
+    def resolve(self, cid, keep_local):
+        # Saisie locale gardée : renvoyée sans contrôle de version. Version distante gardée : déjà en place localement.
+        with self.lock, self.db:
+            c = self.db.execute("SELECT * FROM conflicts WHERE id = ?", (cid,)).fetchone()
+            if c is None: return
+            if keep_local:
+                mine = json.loads(c['local'])
+                self.db.execute(f"UPDATE pointages SET {', '.join(f'{k} = ?' for k in POINTAGE_VALS)}, pending = pending + 1 WHERE salarie_id = ? AND date_pointage = ?",
+                                [mine[k] for k in POINTAGE_VALS] + [c['salarie_id'], c['date_pointage']])
+                self.enqueue("pointages", {"s": c['salarie_id'], "rows": [[c['date_pointage']] + [mine[k] for k in POINTAGE_VALS]], "force": True})
+            self.db.execute("DELETE FROM conflicts WHERE id = ?", (cid,))
+        self.wake.set()
+    def retry_failed(self):
+        with self.lock, self.db: self.db.execute("UPDATE outbox SET attempts = 0 WHERE attempts >= ?", (MAX_ATTEMPTS,))
+        self.wake.set()
+
+def fetch_changes(conn, t, cols, since, overlap, chunk=5000):
+    # Curseur serveur : lots de lignes (tuples dans l'ordre de cols) modifiées après since - overlap, toute la table si since est None
+    with conn.cursor(name=f"mirror_{t}") as cur:
+        cur.itersize = chunk
+        if since: cur.execute(f"SELECT {', '.join(cols)} FROM {t} WHERE updated_at > %s::timestamptz - %s * interval '1 second'", (since, overlap))
+        else: cur.execute(f"SELECT {', '.join(cols)} FROM {t}")
+        while rows := cur.fetchmany(chunk): yield rows
+
+def is_outage(e):
+    # Base injoignable (connexion perdue, pool saturé) : la file attend le cycle suivant sans compter d'essai
+    return isinstance(e, DB_CONN_ERRORS + (pg_pool.PoolError,))
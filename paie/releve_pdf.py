@@ -0,0 +1,33 @@
+import io
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+
+# Rendu des relevés : sans Streamlit, importable par les workers (process pool, contexte spawn)
+
+def releve_story(nom, per, st, s):
+    el = [Paragraph(f"Relevé: {nom} - {per}", s['Heading1']), Spacer(1, 0.5*cm)]
+    d = [["H. Trav.", f"{st['total_real']:.2f}", "TR", f"{st['total_tr']}"], ["HS Tot", f"{st['gen_hs_total']:.2f}", "Congé", f"{st['nb_conge']}"], ["A Payer", f"{st['hs_payable']:.2f}", "Maladie", f"{st['nb_maladie']}"]]
+    t = Table(d, colWidths=[4*cm,3*cm,4*cm,3*cm]); t.setStyle(TableStyle([('GRID',(0,0),(-1,-1),1,colors.black),('BACKGROUND',(0,0),(-1,-1),colors.whitesmoke)])); el.append(t); el.append(Spacer(1, 0.5*cm))
+    det = [["Date","Jour","Statut","M","A","Tot"]]
+    for r in st['details']: det.append([r['Date'],r['Jour'][:3],r['Statut'][:10],r['Matin'],r['Aprem'],f"{r['Heures']:.2f}"])
+    t2 = Table(det, colWidths=[2.5*cm,2*cm,3*cm,3*cm,3*cm,1.5*cm]); t2.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.5,colors.grey)])); el.append(t2)
+    return el
+
+def create_pdf_releve(nom, per, st):
+    b = io.BytesIO(); SimpleDocTemplate(b, pagesize=A4).build(releve_story(nom, per, st, getSampleStyleSheet())); b.seek(0)
+    return b
+
+def create_pdf_releves(items):
+    # Un seul PDF, un relevé par page (nouvelle page à chaque salarié)
+    b = io.BytesIO(); s = getSampleStyleSheet(); el = []
+    for i, (nom, per, st) in enumerate(items):
+        if i: el.append(PageBreak())
+        el.extend(releve_story(nom, per, st, s))
+    SimpleDocTemplate(b, pagesize=A4).build(el); b.seek(0)
+    return b
+
+def render_releve(item): return create_pdf_releve(*item).getvalue()
+def render_releves(items): return create_pdf_releves(items).getvalue()
@@ -0,0 +1,126 @@
+from datetime import date
+from .db import report, run_query, transaction
+
+# --- MIGRATIONS ---
+# Grand livre banque : période (année, mois) et nature ('HS' = transfert d'heures sup, 'AJUST' = correction) en colonnes indexées.
+# Cumul mensuel des transferts matérialisé dans banque_mois, tenu à jour par db_update_banque dans la même transaction.
+LEDGER_BACKFILL = r"""UPDATE banque_history SET nature = CASE WHEN motif ~ 'HS.* \d{1,2}/\d{4}\y' THEN 'HS' ELSE 'AJUST' END,
+    periode_mois = (regexp_match(motif, 'HS.* (\d{1,2})/(\d{4})\y'))[1]::int, periode_annee = (regexp_match(motif, 'HS.* (\d{1,2})/(\d{4})\y'))[2]::int
+    WHERE nature IS NULL"""
+LEDGER_FILL = "INSERT INTO banque_mois (salarie_id, annee, mois, total_hs) SELECT salarie_id, periode_annee, periode_mois, SUM(montant) FROM banque_history WHERE nature = 'HS' GROUP BY 1, 2, 3"
+TIME_USING = r"CASE WHEN {c} ~ '^([01]?\d|2[0-3]):[0-5]\d' THEN substring({c} from '^\d{{1,2}}:\d{{2}}')::time END"
+# Miroir local (paie.miroir) : updated_at posé à chaque écriture, lu par la synchro incrémentale. sync_epoch change quand
+# les données sont remplacées en bloc (restauration, partitionnement) : les miroirs se rechargent entièrement.
+SYNC_TABLES = ["salaries", "pointages", "banque_history"]
+def sync_ddl(t):
+    return [f"CREATE INDEX IF NOT EXISTS idx_{t}_updated_at ON {t} (updated_at)",
+            f"DROP TRIGGER IF EXISTS trg_{t}_updated_at ON {t}",
+            f"CREATE TRIGGER trg_{t}_updated_at BEFORE UPDATE ON {t} FOR EACH ROW EXECUTE FUNCTION touch_updated_at()"]
+def bump_sync_epoch(): run_query("UPDATE sync_epoch SET epoch = now()", fetch="none")
+# (version, description, requêtes) : appliquées une seule fois, dans l'ordre, chacune dans sa propre transaction
+MIGRATIONS = [
+    (1, "tables de base", [
+        '''CREATE TABLE IF NOT EXISTS salaries (id SERIAL PRIMARY KEY, nom TEXT NOT NULL, mode_alternance INTEGER DEFAULT 0, solde_banque REAL DEFAULT 0, config_horaires TEXT, is_archived INTEGER DEFAULT 0)''',
+        '''CREATE TABLE IF NOT EXISTS pointages (id SERIAL PRIMARY KEY, salarie_id INTEGER, date_pointage DATE, m_start TEXT, m_end TEXT, a_start TEXT, a_end TEXT, statut TEXT DEFAULT 'Normal', comment TEXT, UNIQUE(salarie_id, date_pointage))''',
+        '''CREATE TABLE IF NOT EXISTS banque_history (id SERIAL PRIMARY KEY, salarie_id INTEGER, date_mouv DATE, montant REAL, motif TEXT, type_mouv TEXT, auteur TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, is_admin INTEGER DEFAULT 0, is_active INTEGER DEFAULT 0)''']),
+    (2, "grand livre banque", [
+        "ALTER TABLE banque_history ADD COLUMN IF NOT EXISTS nature TEXT, ADD COLUMN IF NOT EXISTS periode_annee INTEGER, ADD COLUMN IF NOT EXISTS periode_mois INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_banque_hs_periode ON banque_history (salarie_id, periode_annee, periode_mois) WHERE nature = 'HS'",
+        "CREATE TABLE IF NOT EXISTS banque_mois (salarie_id INTEGER, annee INTEGER, mois INTEGER, total_hs REAL DEFAULT 0, PRIMARY KEY (salarie_id, annee, mois))",
+        LEDGER_BACKFILL,
+        "INSERT INTO banque_mois (salarie_id, annee, mois, total_hs) SELECT salarie_id, periode_annee, periode_mois, SUM(montant) FROM banque_history WHERE nature = 'HS' AND NOT EXISTS (SELECT 1 FROM banque_mois) GROUP BY 1, 2, 3"]),
+    (3, "index", [
+        "CREATE INDEX IF NOT EXISTS idx_pointages_date ON pointages (date_pointage)",
+        "CREATE INDEX IF NOT EXISTS idx_banque_salarie ON banque_history (salarie_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_salaries_archived ON salaries (is_archived)"]),
+    (4, "horaires en TIME", [
+        "ALTER TABLE pointages " + ", ".join(f"ALTER COLUMN {c} TYPE TIME USING {TIME_USING.format(c=c)}" for c in ["m_start", "m_end", "a_start", "a_end"])]),
+    (5, "clés étrangères ON DELETE CASCADE", [
+        f"DELETE FROM {t} x WHERE NOT EXISTS (SELECT 1 FROM salaries s WHERE s.id = x.salarie_id)" for t in ("pointages", "banque_history", "banque_mois")] + [
+        f"ALTER TABLE {t} ADD CONSTRAINT fk_{t}_salarie FOREIGN KEY (salarie_id) REFERENCES salaries(id) ON DELETE CASCADE" for t in ("pointages", "banque_history", "banque_mois")]),
+    (6, "cumuls mensuels", [
+        '''CREATE TABLE IF NOT EXISTS monthly_stats (salarie_id INTEGER NOT NULL REFERENCES salaries(id) ON DELETE CASCADE, annee INTEGER NOT NULL, mois INTEGER NOT NULL,
+            total_real DOUBLE PRECISION, total_tr INTEGER, nb_conge INTEGER, nb_maladie INTEGER, nb_abs INTEGER, gen_hs_total DOUBLE PRECISION, hs_25 DOUBLE PRECISION, hs_50 DOUBLE PRECISION,
+            banked DOUBLE PRECISION, hs_payable DOUBLE PRECISION, delta_bank DOUBLE PRECISION, weekly TEXT, computed_at TIMESTAMP DEFAULT now(), PRIMARY KEY (salarie_id, annee, mois))''']),
+    (7, "tâches de fond", [
+        '''CREATE TABLE IF NOT EXISTS jobs (id SERIAL PRIMARY KEY, kind TEXT NOT NULL, label TEXT, owner TEXT, status TEXT NOT NULL DEFAULT 'en attente', progress REAL DEFAULT 0,
+            message TEXT, error TEXT, result BYTEA, result_name TEXT, result_mime TEXT, created_at TIMESTAMP DEFAULT now(), started_at TIMESTAMP, finished_at TIMESTAMP)''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner, id)"]),
+    (8, "horodatage des modifications (miroir local)", [
+        """CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN NEW.updated_at := clock_timestamp(); RETURN NEW; END $$"""] + [
+        q for t in SYNC_TABLES for q in (f"ALTER TABLE {t} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()", *sync_ddl(t))] + [
+        "CREATE TABLE IF NOT EXISTS sync_epoch (id INTEGER PRIMARY KEY CHECK (id = 1), epoch TIMESTAMPTZ NOT NULL DEFAULT now())",
+        "INSERT INTO sync_epoch (id) VALUES (1) ON CONFLICT DO NOTHING"]),
+    (9, "résultats de tâches par morceaux", [
+        # Un BYTEA unique plafonne à 1 Go et s'allonge par recopie : le résultat est stocké en morceaux numérotés
+        "CREATE TABLE IF NOT EXISTS job_chunks (job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE, seq INTEGER NOT NULL, data BYTEA NOT NULL, PRIMARY KEY (job_id, seq))",
+        "INSERT INTO job_chunks (job_id, seq, data) SELECT id, 0, result FROM jobs WHERE result IS NOT NULL ON CONFLICT DO NOTHING",
+        "ALTER TABLE jobs DROP COLUMN IF EXISTS result"]),
+]
+
+def schema_version():
+    row = run_query("SELECT COALESCE(MAX(version), 0) AS v FROM schema_version", fetch="one")
+    return row['v'] if row else 0
+
+def init_db():
+    # Verrou consultatif : une seule instance applique une migration donnée, les autres la voient comme faite
+    run_query("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP DEFAULT now())", fetch="none")
+    for v, desc, queries in MIGRATIONS:
+        if v <= schema_version(): continue
+        try:
+            with transaction():
+                run_query("SELECT pg_advisory_xact_lock(8471)", fetch="one")
+                if run_query("SELECT 1 AS ok FROM schema_version WHERE version = %s", (v,), fetch="one"): continue
+                for q in queries: run_query(q, fetch="none")
+                run_query("INSERT INTO schema_version (version, description) VALUES (%s, %s)", (v, desc), fetch="none")
+        except Exception as e: report(e, f"Migration {v} ({desc}) : {e}"); return
+    if is_pointages_partitioned(): ensure_pointages_partitions(date.today().year + 1)
+
+def rebuild_banque_ledger():
+    # Après une restauration : complète nature/période depuis motif et recalcule banque_mois
+    run_query(LEDGER_BACKFILL, fetch="none"); run_query("DELETE FROM banque_mois", fetch="none"); run_query(LEDGER_FILL, fetch="none")
+
+# Partitionnement annuel de pointages (optionnel, lancé depuis l'admin) : la lecture d'un mois ne touche qu'une partition
+def is_pointages_partitioned():
+    row = run_query("SELECT relkind FROM pg_class WHERE oid = to_regclass('pointages')", fetch="one")
+    return bool(row) and row['relkind'] == 'p'
+def ensure_pointages_partitions(last_year, first_year=None):
+    # Partitions annuelles de first_year (défaut : année en cours) à last_year, plus les années tombées entre-temps dans la
+    # partition par défaut. Leurs lignes y sont déplacées dans la même transaction (partition par défaut détachée le temps
+    # de l'opération) : sinon la création échoue, et ces années ne seraient jamais élaguées.
+    years = set(range(first_year or date.today().year, last_year + 1))
+    years |= {r['y'] for r in run_query("SELECT DISTINCT EXTRACT(YEAR FROM date_pointage)::int AS y FROM pointages_default", fetch="all") or []}
+    for y in sorted(years):
+        if run_query("SELECT to_regclass(%s) AS t", (f"pointages_{y}",), fetch="one")['t']: continue
+        rng = f"date_pointage >= '{y}-01-01' AND date_pointage < '{y+1}-01-01'"
+        try:
+            with transaction():
+                run_query("SELECT pg_advisory_xact_lock(8471)", fetch="one")
+                if run_query("SELECT to_regclass(%s) AS t", (f"pointages_{y}",), fetch="one")['t']: continue
+                run_query("ALTER TABLE pointages DETACH PARTITION pointages_default", fetch="none")
+                run_query(f"CREATE TABLE pointages_{y} PARTITION OF pointages FOR VALUES FROM ('{y}-01-01') TO ('{y+1}-01-01')", fetch="none")
+                run_query(f"INSERT INTO pointages SELECT * FROM pointages_default WHERE {rng}", fetch="none")
+                run_query(f"DELETE FROM pointages_default WHERE {rng}", fetch="none")
+                run_query("ALTER TABLE pointages ATTACH PARTITION pointages_default DEFAULT", fetch="none")
+        except Exception as e: report(e, f"Partition pointages_{y} : {e}"); return
+def partition_pointages():
+    if is_pointages_partitioned(): return True
+    try:
+        with transaction():
+            r = run_query("SELECT EXTRACT(YEAR FROM MIN(date_pointage))::int AS a, EXTRACT(YEAR FROM MAX(date_pointage))::int AS b FROM pointages", fetch="one")
+            first, last = r['a'] or date.today().year, max(r['b'] or 0, date.today().year + 1)
+            run_query("ALTER TABLE pointages RENAME TO pointages_old", fetch="none")
+            run_query("CREATE TABLE pointages (LIKE pointages_old INCLUDING DEFAULTS, PRIMARY KEY (id, date_pointage), UNIQUE (salarie_id, date_pointage), "
+                      "CONSTRAINT fk_pointages_part_salarie FOREIGN KEY (salarie_id) REFERENCES salaries(id) ON DELETE CASCADE) PARTITION BY RANGE (date_pointage)", fetch="none")
+            for y in range(first, last + 1):
+                run_query(f"CREATE TABLE pointages_{y} PARTITION OF pointages FOR VALUES FROM ('{y}-01-01') TO ('{y+1}-01-01')", fetch="none")
+            run_query("CREATE TABLE pointages_default PARTITION OF pointages DEFAULT", fetch="none")
+            run_query("CREATE INDEX idx_pointages_part_date ON pointages (date_pointage)", fetch="none")
+            for q in sync_ddl("pointages"): run_query(q.replace("idx_pointages_", "idx_pointages_part_"), fetch="none")
+            run_query("INSERT INTO pointages SELECT * FROM pointages_old", fetch="none")
+            run_query("ALTER SEQUENCE pointages_id_seq OWNED BY pointages.id", fetch="none")
+            run_query("DROP TABLE pointages_old", fetch="none")
+            bump_sync_epoch()
+        return True
+    except Exception as e: report(e, f"Partitionnement : {e}"); return False
@@ -0,0 +1,136 @@
+import calendar
+import functools
+import json
+import numpy as np
+from datetime import date, datetime as dt
+
+# Temps de travail : horaires, plannings (semaines paires / impaires), jours fériés, stats d'un mois.
+# Aucune dépendance à la base ni à Streamlit.
+
+DAYS_FR = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+OPTIONS_STATUT = ["Normal", "Congé", "Arrêt Maladie", "Absence Injustifiée", "Récupération"]
+STD_MS, STD_ME, STD_AS, STD_AE = "08:30", "12:00", "14:00", "17:30"
+TIME_COLS = ["m_start", "m_end", "a_start", "a_end"]
+
+# --- UTILITAIRES TEMPS ---
+def str_to_time(t): return dt.strptime(t, "%H:%M").time() if t else None
+def time_to_str(t): return t.strftime("%H:%M") if t else None
+@functools.lru_cache(maxsize=4096)
+def hhmm_to_min(t):
+    # "HH:MM" -> minutes depuis minuit, parsé une seule fois par valeur distincte (None si vide/invalide)
+    if not t: return None
+    try: p = dt.strptime(str(t)[:5], "%H:%M"); return p.hour*60 + p.minute
+    except: return None
+def clean_time(t):
+    # Valeur d'horaire -> "HH:MM" normalisé (colonnes TIME), None si vide/invalide
+    m = hhmm_to_min(t)
+    return None if m is None else f"{m//60:02d}:{m%60:02d}"
+def calc_duree_journee(m_s, m_e, a_s, a_e):
+    def d(s, e):
+        if s and e:
+            a, b = hhmm_to_min(s), hhmm_to_min(e)
+            if a is not None and b is not None: return max(0.0, (b - a)/60)
+        return 0.0
+    return d(m_s, m_e) + d(a_s, a_e)
+def has_ticket_resto(row):
+    if row['statut'] != 'Normal': return False
+    m = calc_duree_journee(row.get('m_start'), row.get('m_end'), None, None)
+    a = calc_duree_journee(None, None, row.get('a_start'), row.get('a_end'))
+    return True if (m > 0 and a > 0) else False
+
+# --- MOTEUR VECTORISÉ (mois / année en opérations sur tableaux) ---
+def to_minutes(values):
+    m = [hhmm_to_min(v) if v else None for v in values]
+    return np.array([np.nan if x is None else x for x in m], dtype=float)
+def span_hours(s, e):
+    with np.errstate(invalid="ignore"): return np.where(np.isnan(s) | np.isnan(e), 0.0, np.maximum(0.0, (e - s)/60))
+def day_arrays(days, db_pts, cfg):
+    # Une entrée par jour : statut, horaires réels, heures réelles/théoriques, TR, semaine ISO (annee*100+semaine)
+    rows = [db_pts.get(d.strftime("%Y-%m-%d")) or {} for d in days]
+    a = {"days": days, "statut": np.array([r.get('statut', 'Normal') if r else "Normal" for r in rows], dtype=object)}
+    for c in TIME_COLS: a[c] = [r.get(c) if r else None for r in rows]
+    rm = [to_minutes(a[c]) for c in TIME_COLS]
+    iso = [d.isocalendar() for d in days]
+    a["h_m"], a["h_a"] = span_hours(rm[0], rm[1]), span_hours(rm[2], rm[3])
+    a["hr"] = a["h_m"] + a["h_a"]
+    a["ht"] = compile_schedule(cfg).theo_hours_range(days, [i[1] for i in iso])
+    a["tr"] = (a["statut"] == "Normal") & (a["h_m"] > 0) & (a["h_a"] > 0)
+    a["wk"] = np.array([i[0]*100 + i[1] for i in iso], dtype=np.int64)
+    return a
+def weekly_hours(a):
+    # Sommes par semaine ISO dans l'ordre chronologique (bincount = addition séquentielle, comme la boucle scalaire)
+    wk, inv = np.unique(a["wk"], return_inverse=True)
+    return dict(zip(wk.tolist(), np.bincount(inv, weights=a["hr"], minlength=len(wk)).tolist()))
+def is_even_week(d): return d.isocalendar()[1] % 2 == 0
+class Schedule:
+    # config_horaires compilée une fois : horaires et heures théoriques par [parité][jour] (parité 0 = paire, 1 = impaire)
+    __slots__ = ("slots", "theo")
+    def __init__(self, emp_json):
+        cfg = json.loads(emp_json) if emp_json else {}
+        empty = [(None, None, None, None)]*7
+        self.slots = []
+        for key in ("paire", "impaire"):
+            week = cfg.get(key if key in cfg else 'paire')
+            self.slots.append([(d.get('ms'), d.get('me'), d.get('as'), d.get('ae')) for d in week] + empty[len(week):] if week else empty)
+        self.theo = np.array([[calc_duree_journee(*d) for d in week[:7]] for week in self.slots])
+    def day(self, d_obj): return self.slots[d_obj.isocalendar()[1] % 2][d_obj.weekday()]
+    def theo_hours(self, d_obj): return float(self.theo[d_obj.isocalendar()[1] % 2, d_obj.weekday()])
+    def theo_hours_range(self, days, weeks=None):
+        weeks = np.array([d.isocalendar()[1] for d in days]) if weeks is None else np.asarray(weeks)
+        return self.theo[weeks % 2, np.array([d.weekday() for d in days], dtype=int)]
+@functools.lru_cache(maxsize=1024)
+def compile_schedule(emp_json): return Schedule(emp_json)
+def get_config_for_day(emp_json, d_obj): return compile_schedule(emp_json).day(d_obj)
+@functools.lru_cache(maxsize=32)
+def feries_map(y):
+    from jours_feries_france import JoursFeries
+    return {d: nom for nom, d in JoursFeries.for_year(y).items()}
+def get_default_schedule():
+    std = {'ms': STD_MS, 'me': STD_ME, 'as': STD_AS, 'ae': STD_AE}
+    empty = {'ms': None, 'me': None, 'as': None, 'ae': None}
+    week = [std.copy() for _ in range(5)] + [empty.copy()] + [empty.copy()]
+    return {'paire': week, 'impaire': week}
+
+# --- CALCUL STATS (HARMONISÉ) ---
+def compute_stats(db_pts, banked, y, m, cfg):
+    _, last = calendar.monthrange(y, m)
+    days = [date(y, m, d) for d in range(1, last+1)]
+    a = day_arrays(days, db_pts, cfg)
+    stt, hr, ht = a["statut"], a["hr"], a["ht"]
+    
+    # Compteurs
+    nc, nm, na = int((stt=="Congé").sum()), int((stt=="Arrêt Maladie").sum()), int((stt=="Absence Injustifiée").sum())
+    tr = int(a["tr"].sum())
+    
+    h_bk = np.where((stt!="Normal") & (stt!="Récupération"), ht, np.where(stt=="Récupération", 0.0, hr))
+    nr, nt = sum(h_bk.tolist(), 0), sum(ht.tolist(), 0)
+    wh = weekly_hours(a)
+    det = [{"Date": d.strftime("%d/%m/%Y"), "Jour": DAYS_FR[d.weekday()], "Statut": s_, "Matin": f"{ms}-{me}" if ms else "", "Aprem": f"{as_}-{ae}" if as_ else "", "Heures": h}
+           for d, s_, ms, me, as_, ae, h in zip(days, stt.tolist(), a["m_start"], a["m_end"], a["a_start"], a["a_end"], hr.tolist())]
+    
+    h25, h50, ghs = 0, 0, 0
+    for w, h in wh.items():
+        if h>35:
+            s = h-35; ghs+=s
+            h25+=min(s,8); h50+=max(0,s-8)
+            
+    # RETOUR DICTIONNAIRE
+    return {
+        "total_real": nr, 
+        "total_tr": tr, 
+        "nb_conge": nc, 
+        "nb_maladie": nm, 
+        "nb_abs": na, 
+        "gen_hs_total": ghs, 
+        "hs_25": h25, 
+        "hs_50": h50, 
+        "banked": banked, 
+        "hs_payable": max(0, ghs-banked), 
+        "delta_bank": nr-nt, 
+        "weekly": {str(w): h for w, h in wh.items()},
+        "details": det
+    }
+
+def export_months(d_from, d_to):
+    # (année, mois) couverts par la plage, bornes incluses
+    return [(y, m) for y in range(d_from.year, d_to.year+1) for m in range(1, 13) if (d_from.year, d_from.month) <= (y, m) <= (d_to.year, d_to.month)]